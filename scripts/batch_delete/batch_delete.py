@@ -1,12 +1,172 @@
+import os
+import io
+import re
 import csv
+import sys
+import gzip
+import sqlite3
+import tempfile
+import threading
 import requests
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 
-def delete_identifier(identifier, api_base_url, username, password):
+# Column names tried, in order, when --id_col is not given.  "_id" is the
+# column name used by EZID batch downloads (/download_request).
+ID_COLUMN_CANDIDATES = ["_id", "id", "identifier", "Identifier", "ID"]
+
+# Number of distinct identifiers kept in memory before the de-duplication set
+# spills to a temporary on-disk database.
+DEFAULT_DEDUP_MEMORY_LIMIT = 1_000_000
+
+DEFAULT_WORKERS = 4
+
+ARK_RE = re.compile(r"^ark:/?(\d{5}/.+)$", re.IGNORECASE)
+DOI_RE = re.compile(r"^(?:doi:\s*)?(10\.\d{4,9}/\S+)$", re.IGNORECASE)
+RESOLVER_PREFIX_RE = re.compile(
+    r"^https?://(?:dx\.)?(?:doi\.org|n2t\.net|arks\.org|ezid(?:-\w+)?\.cdlib\.org(?:/id)?)/",
+    re.IGNORECASE,
+)
+
+
+def normalize_identifier(value):
+    """Return the EZID form of an identifier, or None if it is not one.
+
+    Accepts "ark:/...", "ark:..." (missing slash), "doi:10...", bare DOIs
+    ("10.5072/FK2...") and resolver URLs such as https://doi.org/10... or
+    https://n2t.net/ark:/...  DOIs are upper-cased as EZID stores them.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    value = RESOLVER_PREFIX_RE.sub("", value)
+    m = ARK_RE.match(value)
+    if m:
+        return f"ark:/{m.group(1)}"
+    m = DOI_RE.match(value)
+    if m:
+        return f"doi:{m.group(1).upper()}"
+    return None
+
+
+class SeenSet:
+    """Memory-bounded set of identifiers used for de-duplication.
+
+    Identifiers are kept in a Python set until `memory_limit` entries, after
+    which they are moved to a temporary SQLite database and all further
+    lookups go to disk.
+    """
+
+    def __init__(self, memory_limit=DEFAULT_DEDUP_MEMORY_LIMIT):
+        self.memory_limit = memory_limit
+        self._mem = set()
+        self._db = None
+        self._db_path = None
+
+    def _spill(self):
+        fd, self._db_path = tempfile.mkstemp(prefix="batch_delete_seen_", suffix=".sqlite")
+        os.close(fd)
+        self._db = sqlite3.connect(self._db_path)
+        self._db.execute("PRAGMA journal_mode=OFF")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute("CREATE TABLE seen (id TEXT PRIMARY KEY) WITHOUT ROWID")
+        self._db.executemany("INSERT INTO seen VALUES (?)", ((i,) for i in self._mem))
+        self._mem = set()
+        print(f"Info: de-duplication set exceeded {self.memory_limit} entries, spilled to {self._db_path}")
+
+    def add(self, identifier):
+        """Add an identifier; return True if it had not been seen before."""
+        if self._db is None:
+            if identifier in self._mem:
+                return False
+            self._mem.add(identifier)
+            if len(self._mem) > self.memory_limit:
+                self._spill()
+            return True
+        cursor = self._db.execute("INSERT OR IGNORE INTO seen VALUES (?)", (identifier,))
+        return cursor.rowcount == 1
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            os.remove(self._db_path)
+            self._db = None
+
+
+def open_input(file_path):
+    """Open a plain or gzip-compressed text file ("-" for stdin) for streaming."""
+    if file_path == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+    with open(file_path, "rb") as f:
+        is_gzip = f.read(2) == b"\x1f\x8b"
+    if is_gzip:
+        return gzip.open(file_path, "rt", encoding="utf-8-sig", newline="")
+    return open(file_path, "r", encoding="utf-8-sig", newline="")
+
+
+def iter_raw_identifiers(stream, id_col=None):
+    """Yield raw identifier values from a CSV, TSV or newline-separated list.
+
+    The format is inferred from the first line: a tab means TSV, a line that
+    is itself an identifier means a headerless list (first column is used),
+    otherwise the first line is a header and the identifier column is
+    `id_col` or the first of ID_COLUMN_CANDIDATES present.
+    """
+    first_line = stream.readline()
+    if not first_line:
+        return
+    delimiter = "\t" if "\t" in first_line else ","
+    header = next(csv.reader([first_line], delimiter=delimiter))
+    reader = csv.reader(stream, delimiter=delimiter)
+
+    if id_col is None and header and normalize_identifier(header[0]):
+        yield header[0]
+        for row in reader:
+            if row:
+                yield row[0]
+        return
+
+    if id_col is None:
+        id_col = next((c for c in ID_COLUMN_CANDIDATES if c in header), None)
+        if id_col is None:
+            raise ValueError(f"Cannot detect identifier column in header {header}; use --id_col")
+        print(f"Info: using identifier column '{id_col}'")
+    elif id_col not in header:
+        raise ValueError(f"Column '{id_col}' not found in header {header}")
+
+    index = header.index(id_col)
+    for row in reader:
+        if len(row) > index:
+            yield row[index]
+
+
+def iter_identifiers(file_path, id_col=None, dedup_memory_limit=DEFAULT_DEDUP_MEMORY_LIMIT):
+    """Stream normalised, de-duplicated identifiers from the input file."""
+    seen = SeenSet(dedup_memory_limit)
+    skipped = duplicates = 0
+    try:
+        with open_input(file_path) as stream:
+            for raw in iter_raw_identifiers(stream, id_col):
+                identifier = normalize_identifier(raw)
+                if identifier is None:
+                    if raw.strip():
+                        print(f"Skipped: not an identifier: {raw!r}")
+                        skipped += 1
+                    continue
+                if not seen.add(identifier):
+                    duplicates += 1
+                    continue
+                yield identifier
+    finally:
+        seen.close()
+        print(f"Info: {skipped} invalid values skipped, {duplicates} duplicates removed")
+
+
+def delete_identifier(identifier, api_base_url, username, password, session=None):
     url = f"{api_base_url}/{identifier}"
 
     try:
-        response = requests.delete(
+        response = (session or requests).delete(
             url,
             auth=(username, password)
         )
@@ -20,13 +180,33 @@ def delete_identifier(identifier, api_base_url, username, password):
         print(f"Error deleting {identifier}: {e}")
 
 
-def process_csv(file_path, api_base_url, username, password, id_col):
-    with open(file_path, newline="") as csvfile:
-        reader = csv.DictReader(csvfile)
+def process_csv(file_path, api_base_url, username, password, id_col=None,
+                workers=DEFAULT_WORKERS, dedup_memory_limit=DEFAULT_DEDUP_MEMORY_LIMIT):
+    """Delete every identifier in the input, streaming it into a worker pool.
 
-        for row in reader:
-            identifier = row[id_col]
-            delete_identifier(identifier, api_base_url, username, password)
+    At most 2 * workers deletes are queued at a time so memory use does not
+    depend on the input size.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    slots = threading.BoundedSemaphore(workers * 2)
+
+    # futures are not kept (memory), so report anything delete_identifier didn't handle here
+    def _delete(identifier):
+        try:
+            delete_identifier(identifier, api_base_url, username, password, session)
+        except Exception as e:
+            print(f"Error deleting {identifier}: {type(e).__name__}: {e}")
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for identifier in iter_identifiers(file_path, id_col, dedup_memory_limit):
+            slots.acquire()
+            executor.submit(_delete, identifier)
+    session.close()
 
 
 def main():
@@ -35,8 +215,14 @@ def main():
     parser.add_argument("--env", required=True, help="environment (e.g., dev, stg, prd)")
     parser.add_argument("--username", required=True, help="API username")
     parser.add_argument("--password", required=True, help="API password")
-    parser.add_argument("--csv", required=True, help="CSV file containing identifiers")
-    parser.add_argument("--id_col", required=True, help="Name of the column containing identifiers")
+    parser.add_argument("--csv", required=True,
+                        help="CSV/TSV file or newline list of identifiers, optionally gzip-compressed ('-' for stdin)")
+    parser.add_argument("--id_col", required=False,
+                        help="Name of the column containing identifiers (auto-detected if omitted)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Number of concurrent delete requests (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--dedup_memory_limit", type=int, default=DEFAULT_DEDUP_MEMORY_LIMIT,
+                        help="Distinct identifiers kept in memory before de-duplication spills to disk")
 
     args = parser.parse_args()
 
@@ -49,8 +235,9 @@ def main():
     else:
         raise ValueError("Invalid environment. Use 'dev', 'stg', or 'prd'.")
 
-    process_csv(args.csv, api_base_url, args.username, args.password, args.id_col)
+    process_csv(args.csv, api_base_url, args.username, args.password, args.id_col,
+                args.workers, args.dedup_memory_limit)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
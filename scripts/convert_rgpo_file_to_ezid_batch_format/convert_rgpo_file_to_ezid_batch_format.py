@@ -1,16 +1,31 @@
 import os
-import re
 import csv
 import sys
+import json
+import time
 import signal
 import logging
 import argparse
 import requests
 from datetime import datetime
 from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from field_mapping import compile_field_spec
+from ror_offline_matcher import open_index
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FIELD_SPEC = os.path.join(SCRIPT_DIR, 'rgpo_fields.txt')
+DEFAULT_BATCH_MAP = os.path.join(SCRIPT_DIR, 'rgpo_map.txt')
 
 interrupted = False
 
+DEFAULT_ROR_CACHE = 'ror_affiliation_cache.json'
+DEFAULT_ROR_CACHE_TTL_DAYS = 30
+DEFAULT_ROR_WORKERS = 8
+DEFAULT_CHECKPOINT_ROWS = 500
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+
 def signal_handler(sig, frame):
     global interrupted
     print("\nGracefully shutting down... (Processed rows have been saved)")
@@ -23,76 +38,39 @@ def parse_arguments():
     parser.add_argument('-i', '--input', required=True, help='Path to the input CSV file')
     parser.add_argument('-o', '--output', required=True, help='Path to the output CSV file')
     parser.add_argument('-m', '--match-affiliations', action='store_true', help='Enable ROR affiliation matching for Institution Names')
-    return parser.parse_args()
-
-def get_template_row():
-    return [
-        {'name': 'Location', 'value': ''},
-        {'name': 'Creator', 'value': 'University of California Office of the President'},
-        {'name': 'Name Identifier', 'value': 'https://ror.org/00dmfq477'},
-        {'name': 'Name Identifier Scheme', 'value': 'ROR'},
-        {'name': 'Name Identifier Scheme URI', 'value': 'https://ror.org/'},
-        {'name': 'Title', 'value': ''},
-        {'name': 'Publisher', 'value': 'University of California Office of the President'},
-        {'name': 'Publisher Identifier', 'value': 'https://ror.org/00dmfq477'},
-        {'name': 'Publisher Identifier Scheme', 'value': 'ROR'},
-        {'name': 'Publisher Identifier Scheme URI', 'value': 'https://ror.org/'},
-        {'name': 'Publication Year', 'value': ''},
-        {'name': 'Resource Type General', 'value': 'Other'},
-        {'name': 'Resource Type', 'value': 'Grant'},
-        {'name': 'Description', 'value': ''},
-        {'name': 'Description Type', 'value': ''},
-        {'name': 'Contributor Type', 'value': 'ProjectLeader'},
-        {'name': 'Contributor Name', 'value': ''},
-        {'name': 'Name Identifier', 'value': ''},
-        {'name': 'Identifier Scheme', 'value': ''},
-        {'name': 'Scheme URI', 'value': ''},
-        {'name': 'Affiliation', 'value': ''},
-        {'name': 'Affiliation Identifier', 'value': ''},
-        {'name': 'Affiliation Identifier Scheme', 'value': ''},
-        {'name': 'Affiliation Identifier Scheme URI', 'value': ''},
-        {'name': 'Date', 'value': ''},
-        {'name': 'Date Type', 'value': ''},
-        {'name': 'Date Information', 'value': ''},
-        {'name': 'Alternate Identifier', 'value': ''},
-        {'name': 'Alternate Identifier Type', 'value': 'award-number'},
-        {'name': 'Related Identifier', 'value': ''},
-        {'name': 'Related Identifier Type', 'value': ''},
-        {'name': 'Relation Type', 'value': ''},
-        {'name': 'Funder Name', 'value': ''},
-        {'name': 'Funder Identifier', 'value': ''},
-        {'name': 'Funder Identifier Type', 'value': ''}
-    ]
-
-def get_target_fieldnames():
-    template = get_template_row()
-    return [field['name'] for field in template]
+    parser.add_argument('--ror-cache', default=DEFAULT_ROR_CACHE, help=f'Path to the on-disk affiliation to ROR ID cache (default: {DEFAULT_ROR_CACHE})')
+    parser.add_argument('--ror-cache-ttl', type=int, default=DEFAULT_ROR_CACHE_TTL_DAYS, help=f'Days before a cached affiliation match is re-queried (default: {DEFAULT_ROR_CACHE_TTL_DAYS})')
+    parser.add_argument('--field-spec', default=DEFAULT_FIELD_SPEC, help='Output column spec mapping input columns to output columns (default: rgpo_fields.txt)')
+    parser.add_argument('--batch-map', default=DEFAULT_BATCH_MAP, help='batch3 mapping file the output columns must match (default: rgpo_map.txt)')
+    parser.add_argument('--checkpoint-rows', type=int, default=DEFAULT_CHECKPOINT_ROWS, help=f'Flush and fsync the output every N rows (default: {DEFAULT_CHECKPOINT_ROWS})')
+    parser.add_argument('--ror-dump', help='Match affiliations offline against this ROR data dump (.zip or .json) instead of the ROR API; implies -m')
+    parser.add_argument('--ror-index', help='Path to the offline ROR index built from --ror-dump (default: <ror-dump>.idx)')
+    parser.add_argument('--ror-workers', type=int, default=DEFAULT_ROR_WORKERS, help=f'Number of concurrent ROR API requests (default: {DEFAULT_ROR_WORKERS})')
+    args = parser.parse_args()
+    if args.ror_index and not args.ror_dump:
+        parser.error('--ror-index requires --ror-dump')
+    if args.ror_dump:
+        args.match_affiliations = True
+    return args
 
 def read_input_csv(input_file_path):
     if not os.path.exists(input_file_path):
         sys.exit(f"Error: Input file '{input_file_path}' not found.")
     try:
-        with open(input_file_path, 'r', encoding='utf-8-sig') as csvfile:
-            reader = csv.DictReader(csvfile)
-            required_columns = ['Application ID', 'Project Title']
-            missing_columns = [col for col in required_columns if col not in reader.fieldnames]
-            if missing_columns:
-                sys.exit(f"Error: Input CSV is missing required columns: {', '.join(missing_columns)}")
-            return csvfile, reader
+        csvfile = open(input_file_path, 'r', encoding='utf-8-sig')
+        reader = csv.DictReader(csvfile)
+        required_columns = ['Application ID', 'Project Title']
+        missing_columns = [col for col in required_columns if col not in reader.fieldnames]
+        if missing_columns:
+            csvfile.close()
+            sys.exit(f"Error: Input CSV is missing required columns: {', '.join(missing_columns)}")
+        return csvfile, reader
     except csv.Error as e:
         sys.exit(f"Error reading CSV file: {e}")
     except Exception as e:
         sys.exit(f"Error: {e}")
 
-def normalize_abstract_text(text):
-    if not text:
-        return ""
-    text = re.sub(r'<[^>]+>', '', text)
-    text = re.sub(r'\s+', ' ', text)
-    text = text.strip()
-    return text
-
-def query_affiliation(affiliation, version='2', use_quotes=False):
+def query_affiliation(affiliation, version='2', use_quotes=False, session=None, raise_errors=False):
     chosen_result = None
     query_url = None
     try:
@@ -100,10 +78,12 @@ def query_affiliation(affiliation, version='2', use_quotes=False):
         query_value = f'"{affiliation}"' if use_quotes else affiliation
         params = {"affiliation": query_value}
         query_url = f"{base_url}?{urlencode(params)}"
-        r = requests.get(base_url, params=params)
+        r = (session or requests).get(base_url, params=params)
         r.raise_for_status()
         if not r.text:
             logging.error(f'Empty response received for affiliation: {affiliation}')
+            if raise_errors:
+                raise requests.exceptions.InvalidJSONError('Empty response body', response=r)
             return None, query_url
         try:
             api_response = r.json()
@@ -111,6 +91,8 @@ def query_affiliation(affiliation, version='2', use_quotes=False):
             logging.error(f'Invalid JSON response for affiliation: {affiliation}')
             logging.error(f'Response status code: {r.status_code}')
             logging.error(f'Response content: {r.text[:500]}')
+            if raise_errors:
+                raise requests.exceptions.InvalidJSONError(str(json_err), response=r) from json_err
             return None, query_url
         results = api_response.get('items', [])
         if results:
@@ -123,90 +105,141 @@ def query_affiliation(affiliation, version='2', use_quotes=False):
     except requests.exceptions.RequestException as req_err:
         logging.error(f'Request error for affiliation: {affiliation}')
         logging.error(f'Error details: {req_err}')
+        if raise_errors:
+            raise
     except Exception as e:
         logging.error(f'Unexpected error for affiliation: {affiliation}')
         logging.error(f'Error type: {type(e).__name__}')
         logging.error(f'Error details: {str(e)}')
     return chosen_result, query_url
 
-def transform_row(input_row, template, match_affiliations=False):
-    output_fields = [field.copy() for field in template]
-    application_id = input_row.get('Application ID', '')
-    affiliation = input_row.get('Institution Name', '')
-    affiliation_identifier = None
-    
-    if match_affiliations and affiliation:
-        chosen_result, _ = query_affiliation(affiliation, '2')
-        if chosen_result:
-            affiliation_identifier, _ = chosen_result
-    
-    for i, field in enumerate(output_fields):
-        field_name = field['name']
-        if field_name == 'Location' and application_id:
-            output_fields[i]['value'] = f"https://rgpogrants.ucop.edu/files/1614305/f480589/index.html?appid={application_id}"
-        elif field_name == 'Title':
-            output_fields[i]['value'] = input_row.get('Project Title', '')
-        elif field_name == 'Contributor Name':
-            output_fields[i]['value'] = input_row.get('Principal Investigator', '')
-        elif field_name == 'Affiliation':
-            output_fields[i]['value'] = affiliation
-        elif field_name == 'Affiliation Identifier':
-            if match_affiliations and affiliation_identifier:
-                output_fields[i]['value'] = affiliation_identifier
-        elif field_name == 'Affiliation Identifier Scheme':
-            if match_affiliations and affiliation_identifier:
-                output_fields[i]['value'] = 'ROR'
-        elif field_name == 'Affiliation Identifier Scheme URI':
-            if match_affiliations and affiliation_identifier:
-                output_fields[i]['value'] = 'https://ror.org/'
-        elif field_name == 'Description':
-            output_fields[i]['value'] = normalize_abstract_text(input_row.get('Lay Abstract', ''))
-        elif field_name == 'Description Type':
-            description_value = ''
-            for f in output_fields:
-                if f['name'] == 'Description':
-                    description_value = f['value']
-                    break
-            if description_value:
-                output_fields[i]['value'] = 'Abstract'
-        elif field_name == 'Date':
-            output_fields[i]['value'] = input_row.get('Start Date', '')
-        elif field_name == 'Date Type':
-            date_value = ''
-            for f in output_fields:
-                if f['name'] == 'Date':
-                    date_value = f['value']
-                    break
-            if date_value:
-                output_fields[i]['value'] = 'Issued'
-        elif field_name == 'Alternate Identifier' and application_id:
-            output_fields[i]['value'] = application_id
-    return [field['value'] for field in output_fields]
+def load_affiliation_cache(cache_path, ttl_days):
+    """Load the affiliation -> ROR match cache, dropping entries older than ttl_days.
 
-def initialize_output_csv(output_file_path, fieldnames):
+    Each entry is {"id": ror_id or None, "score": score or None, "cached_at": epoch seconds};
+    an "id" of None records that ROR returned no chosen match.
+    """
+    if not os.path.exists(cache_path):
+        return {}
     try:
-        with open(output_file_path, 'w', encoding='utf-8', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(fieldnames)
-        return True
-    except Exception as e:
-        sys.exit(f"Error initializing output CSV: {e}")
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.error(f'Ignoring unreadable ROR cache {cache_path}: {e}')
+        return {}
+    cutoff = time.time() - ttl_days * 86400
+    return {k: v for k, v in cache.items() if v.get('cached_at', 0) >= cutoff}
 
-def append_to_output_csv(output_file_path, row_data):
-    try:
-        with open(output_file_path, 'a', encoding='utf-8', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(row_data)
-        return True
-    except Exception as e:
-        logging.error(f"Error appending to output CSV: {e}")
-        return False
+def save_affiliation_cache(cache_path, cache):
+    tmp_path = f'{cache_path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, cache_path)
+
+def collect_affiliations(input_file_path):
+    affiliations = set()
+    with open(input_file_path, 'r', encoding='utf-8-sig') as csvfile:
+        for row in csv.DictReader(csvfile):
+            affiliation = row.get('Institution Name', '')
+            if affiliation:
+                affiliations.add(affiliation)
+    return affiliations
+
+def resolve_affiliations(affiliations, cache, workers=DEFAULT_ROR_WORKERS):
+    """Query ROR for every affiliation not already in the cache, concurrently.
+
+    Results (including "no match") are added to the cache in place. Requests that fail,
+    or get an empty or non-JSON response, are logged and not cached so they are retried
+    on the next run.
+    """
+    pending = sorted(a for a in affiliations if a not in cache)
+    if not pending:
+        return 0
+    print(f"Resolving {len(pending)} uncached affiliations ({len(affiliations)} distinct) against ROR...")
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount('https://', adapter)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(query_affiliation, affiliation, '2', session=session, raise_errors=True): affiliation
+            for affiliation in pending
+        }
+        for future in as_completed(futures):
+            affiliation = futures[future]
+            try:
+                chosen_result, query_url = future.result()
+            except requests.exceptions.RequestException:
+                continue
+            ror_id, score = chosen_result if chosen_result else (None, None)
+            logging.info(f'{query_url} -> {ror_id} (score: {score})')
+            cache[affiliation] = {'id': ror_id, 'score': score, 'cached_at': time.time()}
+    session.close()
+    return len(pending)
+
+def match_affiliations_offline(affiliations, ror_index):
+    """Match affiliations against a local ROR index; returns entries shaped like the cache."""
+    print(f"Matching {len(affiliations)} distinct affiliations against the offline ROR index...")
+    matches = {}
+    now = time.time()
+    for affiliation in affiliations:
+        chosen_result, candidates = ror_index.match(affiliation)
+        ror_id, score = chosen_result if chosen_result else (None, None)
+        logging.info(f'offline: {affiliation} -> {ror_id} (score: {score}, candidates: {candidates[:3]})')
+        matches[affiliation] = {'id': ror_id, 'score': score, 'cached_at': now}
+    return matches
+
+def transform_row(input_row, mapping, match_affiliations=False, affiliation_cache=None):
+    affiliation_lookup = None
+    if match_affiliations:
+        if affiliation_cache is not None:
+            affiliation_lookup = lambda affiliation: affiliation_cache.get(affiliation, {}).get('id')
+        else:
+            def affiliation_lookup(affiliation):
+                chosen_result, _ = query_affiliation(affiliation, '2')
+                return chosen_result[0] if chosen_result else None
+    return mapping.apply(input_row, affiliation_lookup)
+
+class CheckpointedCsvWriter:
+    """CSV writer holding one buffered handle on the output file for the whole run.
+
+    Rows are buffered in memory and made durable with flush + fsync every
+    `checkpoint_rows` rows and on close, so an interrupted run keeps every row
+    up to the last checkpoint.
+    """
+
+    def __init__(self, output_file_path, fieldnames, checkpoint_rows=DEFAULT_CHECKPOINT_ROWS):
+        try:
+            self._file = open(output_file_path, 'w', encoding='utf-8', newline='', buffering=OUTPUT_BUFFER_SIZE)
+        except Exception as e:
+            sys.exit(f"Error initializing output CSV: {e}")
+        self._writer = csv.writer(self._file)
+        self._checkpoint_rows = checkpoint_rows
+        self._pending = 0
+        self._writer.writerow(fieldnames)
+
+    def writerow(self, row_data):
+        self._writer.writerow(row_data)
+        self._pending += 1
+        if self._pending >= self._checkpoint_rows:
+            self.checkpoint()
+
+    def checkpoint(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.checkpoint()
+            self._file.close()
 
 def main():
     global interrupted
     args = parse_arguments()
-    template = get_template_row()
-    target_fieldnames = get_target_fieldnames()
+    try:
+        mapping = compile_field_spec(args.field_spec, args.batch_map)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Error loading field spec: {e}")
     
     if args.match_affiliations:
         now = datetime.now()
@@ -216,38 +249,53 @@ def main():
                           format='%(asctime)s %(levelname)s %(message)s')
         logging.info("Starting transformation with affiliation matching enabled")
     
-    initialize_output_csv(args.output, target_fieldnames)
-    
     csv_file, reader = read_input_csv(args.input)
+
+    affiliation_cache = None
+    if args.match_affiliations and args.ror_dump:
+        ror_index = open_index(args.ror_dump, args.ror_index)
+        affiliation_cache = match_affiliations_offline(collect_affiliations(args.input), ror_index)
+        ror_index.close()
+    elif args.match_affiliations:
+        affiliation_cache = load_affiliation_cache(args.ror_cache, args.ror_cache_ttl)
+        affiliations = collect_affiliations(args.input)
+        queried = resolve_affiliations(affiliations, affiliation_cache, args.ror_workers)
+        if queried:
+            save_affiliation_cache(args.ror_cache, affiliation_cache)
+        logging.info(f"{len(affiliations)} distinct affiliations, {queried} ROR queries")
+
+    writer = CheckpointedCsvWriter(args.output, mapping.fieldnames, args.checkpoint_rows)
     
+    # progress is reported from the byte position of the input so the file is only read once
+    input_size = os.path.getsize(args.input) or 1
+    processed_rows = 0
     try:
-        total_rows = 0
-        processed_rows = 0
-        with open(args.input, 'r', encoding='utf-8-sig') as f:
-            total_rows = sum(1 for _ in csv.reader(f)) - 1
-        
-        print(f"Processing {total_rows} rows...")
+        print(f"Processing {args.input} ({input_size} bytes)...")
         for row in reader:
             if interrupted:
                 break
                 
-            transformed_row = transform_row(row, template, args.match_affiliations)
-            append_to_output_csv(args.output, transformed_row)
+            transformed_row = transform_row(row, mapping, args.match_affiliations, affiliation_cache)
+            writer.writerow(transformed_row)
             
             processed_rows += 1
-            if processed_rows % 10 == 0 or processed_rows == total_rows:
-                progress = (processed_rows / total_rows) * 100
-                print(f"Progress: {processed_rows}/{total_rows} rows ({progress:.1f}%)", end='\r')
+            if processed_rows % 10 == 0:
+                progress = min(csv_file.buffer.tell() / input_size, 1.0) * 100
+                print(f"Progress: {processed_rows} rows ({progress:.1f}%)", end='\r')
         
+        writer.close()
+        if not interrupted:
+            print(f"Progress: {processed_rows} rows (100.0%)", end='\r')
         print("\nTransformation complete. Output written to", args.output)
         if interrupted:
-            print(f"Process was interrupted. {processed_rows}/{total_rows} rows were processed.")
+            print(f"Process was interrupted. {processed_rows} rows were processed.")
         
     except Exception as e:
         logging.error(f"Error during processing: {e}")
         print(f"Error during processing: {e}")
         print(f"Partial results saved to {args.output} ({processed_rows} rows processed)")
     finally:
+        writer.close()
         csv_file.close()
 
 if __name__ == "__main__":
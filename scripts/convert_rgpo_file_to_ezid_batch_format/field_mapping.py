@@ -0,0 +1,135 @@
+"""Compile an output column spec (e.g. rgpo_fields.txt) into a row mapping.
+
+The spec is parsed once into a flat list of extractors, one per output
+column, plus a list of derived-field rules that depend on other output
+columns. FieldMapping.apply() then builds each output row in a single pass
+over those lists, so a new funder format is a new spec file rather than a
+code change. See rgpo_fields.txt for the spec syntax.
+"""
+
+import re
+
+_SPEC_LINE_RE = re.compile(r'^\$(\d+)\s*\|\s*(.*?)\s*\|\s*(\w+):(.*)$')
+_MAP_COLUMN_RE = re.compile(r'\$(\d+)')
+_PLACEHOLDER_RE = re.compile(r'\{([^}]+)\}')
+_TAG_RE = re.compile(r'<[^>]+>')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_abstract_text(text):
+    if not text:
+        return ""
+    text = _TAG_RE.sub('', text)
+    text = _SPACE_RE.sub(' ', text)
+    text = text.strip()
+    return text
+
+
+def _column(name):
+    return lambda row, lookup: row.get(name) or ''
+
+
+def _const(text):
+    return lambda row, lookup: text
+
+
+def _abstract(name):
+    return lambda row, lookup: normalize_abstract_text(row.get(name))
+
+
+def _format(template):
+    names = _PLACEHOLDER_RE.findall(template)
+
+    def extract(row, lookup):
+        values = {name: row.get(name) or '' for name in names}
+        if not all(values.values()):
+            return ''
+        return template.format_map(values)
+    return extract
+
+
+def _ror(name):
+    def extract(row, lookup):
+        value = row.get(name)
+        if lookup is None or not value:
+            return ''
+        return lookup(value) or ''
+    return extract
+
+
+EXTRACTORS = {
+    'const': _const,
+    'column': _column,
+    'abstract': _abstract,
+    'format': _format,
+    'ror': _ror,
+}
+
+
+def read_batch_map_columns(map_path):
+    """Return the set of $n column numbers referenced by a batch3 mapping file."""
+    with open(map_path, 'r', encoding='utf-8') as f:
+        return {int(n) for line in f for n in _MAP_COLUMN_RE.findall(line)}
+
+
+class FieldMapping:
+    def __init__(self, fieldnames, extractors, derived):
+        self.fieldnames = fieldnames
+        self._extractors = extractors
+        self._derived = derived
+
+    def apply(self, input_row, affiliation_lookup=None):
+        """Map one input row (dict) to a tuple of output values.
+
+        affiliation_lookup(value) returns the ROR ID for "ror:" columns, or
+        None when affiliation matching is disabled.
+        """
+        values = [extract(input_row, affiliation_lookup) for extract in self._extractors]
+        for index, source, text in self._derived:
+            if values[source]:
+                values[index] = text
+        return tuple(values)
+
+
+def compile_field_spec(spec_path, map_path=None):
+    """Compile a column spec; if map_path is given, check it covers the same $n columns."""
+    columns = {}
+    with open(spec_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            m = _SPEC_LINE_RE.match(line)
+            if not m:
+                raise ValueError(f'{spec_path}:{line_no}: cannot parse "{line}"')
+            number, header, kind, arg = int(m.group(1)), m.group(2), m.group(3), m.group(4)
+            if number in columns:
+                raise ValueError(f'{spec_path}:{line_no}: column ${number} defined twice')
+            if kind != 'if' and kind not in EXTRACTORS:
+                raise ValueError(f'{spec_path}:{line_no}: unknown rule "{kind}"')
+            columns[number] = (header, kind, arg.strip() if kind != 'const' else arg)
+
+    if sorted(columns) != list(range(1, len(columns) + 1)):
+        raise ValueError(f'{spec_path}: columns must be numbered $1..${len(columns)} without gaps')
+    if map_path is not None:
+        mapped = read_batch_map_columns(map_path)
+        if mapped != set(columns):
+            raise ValueError(f'{spec_path} defines columns {sorted(set(columns) - mapped)} not in {map_path} '
+                             f'and {map_path} uses columns {sorted(mapped - set(columns))} not in {spec_path}')
+
+    fieldnames = []
+    extractors = []
+    derived = []
+    for number in range(1, len(columns) + 1):
+        header, kind, arg = columns[number]
+        fieldnames.append(header)
+        if kind == 'if':
+            source, _, text = arg.partition(' ')
+            source_number = int(source.lstrip('$'))
+            if source_number not in columns or columns[source_number][1] == 'if':
+                raise ValueError(f'{spec_path}: ${number} depends on ${source_number}, which is not an extracted column')
+            derived.append((number - 1, source_number - 1, text.strip()))
+            extractors.append(_const(''))
+        else:
+            extractors.append(EXTRACTORS[kind](arg))
+    return FieldMapping(fieldnames, extractors, derived)
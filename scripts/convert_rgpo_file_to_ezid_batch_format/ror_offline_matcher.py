@@ -0,0 +1,252 @@
+"""Offline ROR affiliation matching against a local ROR data dump.
+
+ROR publishes full data dumps (https://doi.org/10.5281/zenodo.6347574) as a zip
+containing a JSON array of organization records. build_index() reads a dump
+once and writes a compact, sorted, memory-mappable index file; RorIndex then
+answers affiliation queries from that file without touching api.ror.org.
+
+Index file layout (UTF-8 text, one record per line, tab-separated):
+
+    ror-index 1 <names_start> <names_end> <tokens_start> <tokens_end>
+    <normalized name>\t<ror id suffix>\t<name type>      (sorted by name)
+    ...
+    <token>\t<offset>,<offset>,...                       (sorted by token)
+    ...
+
+Offsets in the token section are byte offsets of lines in the name section.
+Both sections are binary-searched directly in the mmap, so opening an index
+costs no parsing and almost no memory.
+"""
+
+import io
+import os
+import re
+import json
+import mmap
+import zipfile
+import logging
+import unicodedata
+from collections import defaultdict
+
+ROR_URL_PREFIX = 'https://ror.org/'
+INDEX_MAGIC = 'ror-index 1'
+
+# Names of these types count as a full match; acronym matches never do,
+# mirroring the ROR affiliation endpoint which never marks them "chosen".
+FULL_NAME_TYPES = ('ror_display', 'label', 'alias')
+
+# Score at or above which a unique best candidate is "chosen" (ROR uses 0.9 as well).
+CHOSEN_THRESHOLD = 0.9
+
+# Tokens matching more names than this are not used to collect candidates.
+MAX_POSTINGS = 5000
+
+STOPWORDS = frozenset(['of', 'the', 'and', 'at', 'for', 'in', 'de', 'la', 'du', 'des', 'der', 'y', 'e'])
+
+_NON_ALNUM_RE = re.compile(r'[^0-9a-z]+')
+
+
+def normalize_name(name):
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(c for c in name if not unicodedata.combining(c)).lower()
+    name = name.replace('&', ' and ')
+    return _NON_ALNUM_RE.sub(' ', name).strip()
+
+
+def tokenize(normalized_name):
+    return [t for t in normalized_name.split() if t not in STOPWORDS]
+
+
+def _iter_dump_records(dump_path):
+    if zipfile.is_zipfile(dump_path):
+        with zipfile.ZipFile(dump_path) as zf:
+            json_names = [n for n in zf.namelist() if n.endswith('.json')]
+            if not json_names:
+                raise ValueError(f'No JSON file found in ROR dump {dump_path}')
+            # prefer the schema v2 file when a dump ships both v1 and v2
+            json_names.sort(key=lambda n: 'schema_v2' not in n)
+            with zf.open(json_names[0]) as f:
+                records = json.load(io.TextIOWrapper(f, encoding='utf-8'))
+    else:
+        with open(dump_path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+    yield from records
+
+
+def _iter_record_names(record):
+    """Yield (name, name_type) for both v2 ("names") and v1 record schemas."""
+    if 'names' in record:
+        for entry in record['names']:
+            types = entry.get('types') or ['alias']
+            for name_type in types:
+                yield entry['value'], name_type
+        return
+    yield record.get('name', ''), 'ror_display'
+    for alias in record.get('aliases', []):
+        yield alias, 'alias'
+    for acronym in record.get('acronyms', []):
+        yield acronym, 'acronym'
+    for label in record.get('labels', []):
+        yield label.get('label', ''), 'label'
+
+
+def build_index(dump_path, index_path):
+    """Build an index file from a ROR dump; returns the number of name entries."""
+    entries = set()
+    for record in _iter_dump_records(dump_path):
+        if record.get('status', 'active') != 'active':
+            continue
+        ror_suffix = record['id'].rsplit('/', 1)[-1]
+        for name, name_type in _iter_record_names(record):
+            normalized = normalize_name(name)
+            if normalized:
+                entries.add((normalized.encode('utf-8'), ror_suffix, name_type))
+
+    name_lines = []
+    postings = defaultdict(list)
+    offset = 0
+    for normalized, ror_suffix, name_type in sorted(entries):
+        line = normalized + f'\t{ror_suffix}\t{name_type}\n'.encode('utf-8')
+        name_lines.append(line)
+        for token in set(tokenize(normalized.decode('utf-8'))):
+            postings[token.encode('utf-8')].append(offset)
+        offset += len(line)
+
+    token_lines = [
+        token + b'\t' + b','.join(str(o).encode('ascii') for o in offsets) + b'\n'
+        for token, offsets in sorted(postings.items())
+    ]
+
+    # the header is fixed width so section offsets are known before writing it
+    header_len = len(INDEX_MAGIC) + 4 * 13 + 1
+    names_start = header_len
+    names_end = names_start + offset
+    tokens_end = names_end + sum(len(line) for line in token_lines)
+    header = f'{INDEX_MAGIC}{names_start:>13}{names_end:>13}{names_end:>13}{tokens_end:>13}\n'
+    with open(index_path, 'wb') as f:
+        f.write(header.encode('ascii'))
+        f.writelines(name_lines)
+        f.writelines(token_lines)
+    logging.info(f'Built ROR index {index_path}: {len(name_lines)} names, {len(token_lines)} tokens')
+    return len(name_lines)
+
+
+class RorIndex:
+    """Read-only view of an index file built by build_index()."""
+
+    def __init__(self, index_path):
+        self._file = open(index_path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = self._mm[:self._mm.find(b'\n')].decode('ascii')
+        if not header.startswith(INDEX_MAGIC):
+            raise ValueError(f'{index_path} is not a ROR index file')
+        fields = header[len(INDEX_MAGIC):]
+        self._names_start, self._names_end, self._tokens_start, self._tokens_end = (
+            int(fields[i:i + 13]) for i in range(0, 52, 13))
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def _lower_bound(self, start, end, key):
+        """Return the offset of the first line in [start, end) whose key is >= key."""
+        mm = self._mm
+        lo, hi = start, end
+        while lo < hi:
+            mid = (lo + hi) // 2
+            nl = mm.rfind(b'\n', lo, mid)
+            line_start = lo if nl == -1 else nl + 1
+            line_end = mm.find(b'\n', line_start, end)
+            if mm[line_start:mm.find(b'\t', line_start, line_end)] < key:
+                lo = line_end + 1
+            else:
+                hi = line_start
+        return lo
+
+    def _name_line(self, offset):
+        mm = self._mm
+        line_end = mm.find(b'\n', offset)
+        normalized, ror_suffix, name_type = mm[offset:line_end].decode('utf-8').split('\t')
+        return normalized, ror_suffix, name_type, line_end + 1
+
+    def lookup_name(self, normalized):
+        """Return [(ror_suffix, name_type)] for names exactly equal to `normalized`."""
+        key = normalized.encode('utf-8')
+        pos = self._lower_bound(self._names_start, self._names_end, key)
+        matches = []
+        while pos < self._names_end:
+            name, ror_suffix, name_type, pos = self._name_line(pos)
+            if name != normalized:
+                break
+            matches.append((ror_suffix, name_type))
+        return matches
+
+    def postings(self, token):
+        key = token.encode('utf-8')
+        mm = self._mm
+        pos = self._lower_bound(self._tokens_start, self._tokens_end, key)
+        if pos >= self._tokens_end:
+            return []
+        line_end = mm.find(b'\n', pos)
+        found, _, offsets = mm[pos:line_end].partition(b'\t')
+        if found != key:
+            return []
+        return [self._names_start + int(o) for o in offsets.split(b',')]
+
+    def match(self, affiliation):
+        """Score an affiliation string locally.
+
+        Returns (chosen_result, candidates) where chosen_result is
+        (ror_id, score) or None, as in query_affiliation, and candidates is
+        the best-first list of (ror_id, score, name_type).
+        """
+        normalized = normalize_name(affiliation)
+        if not normalized:
+            return None, []
+        scores = {}
+        for ror_suffix, name_type in self.lookup_name(normalized):
+            score = 1.0 if name_type in FULL_NAME_TYPES else CHOSEN_THRESHOLD
+            if score > scores.get(ror_suffix, (0, ''))[0]:
+                scores[ror_suffix] = (score, name_type)
+
+        if not any(score == 1.0 for score, _ in scores.values()):
+            query_tokens = set(tokenize(normalized))
+            token_postings = [self.postings(t) for t in query_tokens]
+            usable = [p for p in token_postings if 0 < len(p) <= MAX_POSTINGS]
+            if not usable:
+                usable = sorted((p for p in token_postings if p), key=len)[:1]
+            seen_offsets = set()
+            for offsets in usable:
+                for offset in offsets:
+                    if offset in seen_offsets:
+                        continue
+                    seen_offsets.add(offset)
+                    name, ror_suffix, name_type, _ = self._name_line(offset)
+                    if name_type not in FULL_NAME_TYPES:
+                        continue
+                    name_tokens = set(tokenize(name))
+                    common = len(query_tokens & name_tokens)
+                    if not common:
+                        continue
+                    # Dice coefficient over the token sets
+                    score = round(2 * common / (len(query_tokens) + len(name_tokens)), 2)
+                    if score > scores.get(ror_suffix, (0, ''))[0]:
+                        scores[ror_suffix] = (score, name_type)
+
+        candidates = sorted(((ROR_URL_PREFIX + suffix, score, name_type)
+                             for suffix, (score, name_type) in scores.items()),
+                            key=lambda c: -c[1])
+        chosen_result = None
+        if candidates and candidates[0][1] >= CHOSEN_THRESHOLD and candidates[0][2] in FULL_NAME_TYPES:
+            if len(candidates) == 1 or candidates[1][1] < candidates[0][1]:
+                chosen_result = candidates[0][0], candidates[0][1]
+        return chosen_result, candidates
+
+
+def open_index(dump_path, index_path=None):
+    """Open the index for a dump, building it first if missing or older than the dump."""
+    index_path = index_path or f'{dump_path}.idx'
+    if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(dump_path):
+        print(f"Building offline ROR index {index_path} from {dump_path}...")
+        build_index(dump_path, index_path)
+    return RorIndex(index_path)
@@ -0,0 +1,317 @@
+"""Asyncio engine for check_resolution.py (``--engine async``).
+
+Keeps up to ``--concurrency`` checks per resolver in flight on a single event
+loop. Every check starts at the resolver, so it may take that many concurrent
+requests; redirect targets get at most ``--per-host`` concurrent requests (and
+idle keep-alive connections) per host, so no single target institution is
+hammered. Each resolver has its own connection pool and workers, fed through a
+bounded queue, so memory does not grow with the size of the work list. Stdlib
+only: speaks just enough HTTP/1.1 for HEAD/GET and redirects.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import ssl
+import time
+import urllib.parse
+from collections import defaultdict
+
+from check_resolution import (
+    DEFAULT_MAX_RETRIES, MAX_DRAIN_BYTES, MAX_REDIRECTS, REDIRECT_STATUSES, AdaptiveLimit,
+    block_signal, build_url, make_result, redirect_url, retry_delay, throttle_signal,
+)
+
+_Conn = tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+async def _read_chunked(reader: asyncio.StreamReader) -> None:
+    while True:
+        size = int((await reader.readline()).split(b";", 1)[0].strip() or b"0", 16)
+        if size == 0:
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            return
+        await reader.readexactly(size + 2)
+
+
+async def _exchange(conn: _Conn, method: str, target: str,
+                    headers: dict) -> tuple[int, str, dict, bytes, bool]:
+    """Send one request and read the response head; returns (status, reason, headers, body, keep_alive).
+
+    Bodies of redirects and small responses are drained so the connection can
+    be reused (body holds a drained non-redirect body); otherwise keep_alive is
+    False and the caller closes it."""
+    reader, writer = conn
+    lines = [f"{method} {target} HTTP/1.1"] + [f"{k}: {v}" for k, v in headers.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("connection closed by server")
+    version, status, reason = (status_line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+    status = int(status)
+    resp_headers: dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        resp_headers[name.strip().lower()] = value.strip()
+
+    keep_alive = version == "HTTP/1.1" and resp_headers.get("connection", "").lower() != "close"
+    length = resp_headers.get("content-length")
+    body = b""
+    if method == "HEAD" or status in (204, 304) or status < 200:
+        pass
+    elif "chunked" in resp_headers.get("transfer-encoding", "").lower():
+        if status in REDIRECT_STATUSES:
+            await _read_chunked(reader)
+        else:
+            keep_alive = False
+    elif length is not None and length.isdigit() and (
+            status in REDIRECT_STATUSES or int(length) <= MAX_DRAIN_BYTES):
+        body = await reader.readexactly(int(length))
+        if status in REDIRECT_STATUSES:
+            body = b""
+    else:
+        keep_alive = False
+    return status, reason, resp_headers, body, keep_alive
+
+
+def _host_key(parts: urllib.parse.SplitResult) -> tuple:
+    return parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80)
+
+
+class AsyncHttpPool:
+    """Keep-alive connections and a concurrency cap per (scheme, host, port).
+
+    The cap is `per_host`, except for the `resolver` host, which gets `resolver_limit`."""
+
+    def __init__(self, *, timeout: int, per_host: int, resolver: str | None = None,
+                 resolver_limit: int | None = None):
+        self.timeout = timeout
+        self.per_host = per_host
+        self._context = ssl.create_default_context()
+        self._idle: dict[tuple, list[_Conn]] = defaultdict(list)
+        self._limits: dict[tuple, asyncio.Semaphore] = {}
+        self._caps: dict[tuple, int] = {}
+        if resolver and resolver_limit:
+            self._caps[_host_key(urllib.parse.urlsplit(resolver))] = resolver_limit
+
+    async def _open(self, scheme: str, host: str, port: int) -> _Conn:
+        tls = scheme == "https"
+        return await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=self._context if tls else None,
+                                    server_hostname=host if tls else None), self.timeout)
+
+    @staticmethod
+    def _close(conn: _Conn) -> None:
+        conn[1].close()
+
+    async def request(self, method: str, url: str, headers: dict) -> tuple[int, str, dict, bytes]:
+        """Send one request (no redirect following); returns (status, reason, headers, body)."""
+        parts = urllib.parse.urlsplit(url)
+        key = _host_key(parts)
+        scheme, _, port = key
+        cap = self._caps.get(key, self.per_host)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        headers = {"Host": parts.netloc, **headers}
+
+        limit = self._limits.get(key)
+        if limit is None:
+            limit = self._limits[key] = asyncio.Semaphore(cap)
+        async with limit:
+            idle = self._idle[key]
+            conn = idle.pop() if idle else None
+            reused = conn is not None
+            if conn is None:
+                conn = await self._open(scheme, parts.hostname, port)
+            try:
+                try:
+                    status, reason, resp_headers, body, keep_alive = await asyncio.wait_for(
+                        _exchange(conn, method, target, headers), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    self._close(conn)
+                    if not reused:
+                        raise
+                    # the server closed an idle keep-alive connection; retry once on a fresh one
+                    conn = await self._open(scheme, parts.hostname, port)
+                    status, reason, resp_headers, body, keep_alive = await asyncio.wait_for(
+                        _exchange(conn, method, target, headers), self.timeout)
+            except BaseException:
+                self._close(conn)
+                raise
+            if keep_alive and len(idle) < cap:
+                idle.append(conn)
+            else:
+                self._close(conn)
+        return status, reason, resp_headers, body
+
+    def close(self) -> None:
+        for conns in self._idle.values():
+            for conn in conns:
+                self._close(conn)
+        self._idle.clear()
+
+
+async def _request(url: str, *, method: str, user_agent: str, pool: AsyncHttpPool,
+                   follow: bool = True) -> tuple[int | None, str | None, str | None, str | None]:
+    """Async counterpart of check_resolution._request."""
+    headers = {"User-Agent": user_agent, "Accept-Encoding": "identity"}
+    try:
+        for _ in range(MAX_REDIRECTS + 1 if follow else 1):
+            status, reason, resp_headers, body = await pool.request(method, url, headers)
+            location = resp_headers.get("location")
+            if status not in REDIRECT_STATUSES or not location:
+                break
+            url = redirect_url(url, location)
+            if not follow:
+                return status, url, None, None
+        else:
+            return status, url, f"HTTP {status}: too many redirects", None
+        if status >= 400:
+            return status, url, f"HTTP {status}: {reason}", block_signal(status, resp_headers.get, body)
+        if status in REDIRECT_STATUSES and not follow:
+            return status, url, f"HTTP {status}: redirect without Location", None
+        return status, url, None, None
+    except asyncio.TimeoutError:
+        return None, None, "TimeoutError: timed out", None
+    except (ConnectionError, asyncio.IncompleteReadError) as e:
+        return None, None, f"{type(e).__name__}: {e}", "reset"
+    except Exception as e:
+        return None, None, f"{type(e).__name__}: {e}", None
+
+
+async def check_ark(*, resolver: str, ark: str, ark_kind: str, ctx: dict, user_agent: str,
+                    pool: AsyncHttpPool, follow: bool = True, retries: int = 0) -> dict:
+    """Async counterpart of check_resolution.check_ark."""
+    url = build_url(resolver, ark)
+    started = time.monotonic()
+    status, final_url, err, block = await _request(url, method="HEAD", user_agent=user_agent,
+                                                   pool=pool, follow=follow)
+    if status == 405:
+        status, final_url, err, block = await _request(url, method="GET", user_agent=user_agent,
+                                                       pool=pool, follow=follow)
+    elapsed_ms = int((time.monotonic() - started) * 1000)
+    return make_result(resolver=resolver, ark=ark, ark_kind=ark_kind, url=url, status=status,
+                       final_url=final_url, elapsed_ms=elapsed_ms, err=err, ctx=ctx, follow=follow,
+                       block=block, retries=retries)
+
+
+class AsyncThrottle(AdaptiveLimit):
+    """AdaptiveLimit shared by the worker tasks checking one resolver."""
+
+    def __init__(self, max_limit: int, name: str):
+        super().__init__(max_limit, name)
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), self.paused_until - now)
+                    except asyncio.TimeoutError:
+                        pass
+                elif self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return
+                else:
+                    await self._cond.wait()
+
+    async def release(self, block: str | None) -> None:
+        async with self._cond:
+            self.finished(block, time.monotonic())
+            self._cond.notify_all()
+
+
+async def check_with_retries(*, throttle: AsyncThrottle | None, max_retries: int, **kwargs) -> dict:
+    """Async counterpart of check_resolution.check_with_retries."""
+    retries = 0
+    previous = None
+    while True:
+        result = None
+        if throttle:
+            await throttle.acquire()
+        try:
+            result = await check_ark(retries=retries, **kwargs)
+        finally:
+            if throttle:
+                await throttle.release(throttle_signal(previous, result))
+        delay = retry_delay(result["block"], retries, max_retries,
+                            throttled=throttle is not None and throttle.throttled)
+        if delay is None:
+            return result
+        await asyncio.sleep(delay)
+        previous = result
+        retries += 1
+
+
+async def _run(work, *, user_agent: str, timeout: int, concurrency: int, per_host: int,
+               on_result, backoff: bool, max_retries: int, throttles: dict) -> None:
+    main = asyncio.current_task()
+    queues: dict[str, asyncio.Queue] = {}
+    pools: list[AsyncHttpPool] = []
+    workers: list[asyncio.Task] = []
+
+    async def worker(queue: asyncio.Queue, pool: AsyncHttpPool, throttle: AsyncThrottle | None) -> None:
+        while (item := await queue.get()) is not None:
+            resolver, ark, kind, ctx, follow = item
+            on_result(await check_with_retries(
+                throttle=throttle, max_retries=max_retries, resolver=resolver, ark=ark,
+                ark_kind=kind, ctx=ctx, user_agent=user_agent, pool=pool, follow=follow))
+
+    def worker_done(task: asyncio.Task) -> None:
+        # a failed worker would leave the feeding loop blocked on a full queue
+        if not task.cancelled() and task.exception() is not None:
+            main.cancel()
+
+    def lane(resolver: str) -> asyncio.Queue:
+        """The queue of `resolver`, starting its pool, throttle and workers on first use."""
+        queue = queues.get(resolver)
+        if queue is None:
+            queue = queues[resolver] = asyncio.Queue(maxsize=concurrency * 2)
+            pool = AsyncHttpPool(timeout=timeout, per_host=per_host, resolver=resolver,
+                                 resolver_limit=concurrency)
+            pools.append(pool)
+            # the pool lets `concurrency` requests through to the resolver, so every cut in
+            # the throttle's limit is a real cut in load
+            throttle = throttles[resolver] = AsyncThrottle(concurrency, resolver) if backoff else None
+            for _ in range(concurrency):
+                task = asyncio.create_task(worker(queue, pool, throttle))
+                task.add_done_callback(worker_done)
+                workers.append(task)
+        return queue
+
+    try:
+        for item in work:
+            await lane(item[0]).put(item)
+        for queue in queues.values():
+            for _ in range(concurrency):
+                await queue.put(None)
+        await asyncio.gather(*workers)
+    except asyncio.CancelledError:
+        for task in workers:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+        raise
+    finally:
+        for pool in pools:
+            pool.close()
+
+
+def run_async(work, *, user_agent: str, timeout: int, concurrency: int, per_host: int,
+              on_result, backoff: bool = True,
+              max_retries: int = DEFAULT_MAX_RETRIES) -> dict[str, AdaptiveLimit]:
+    """Run checks over `work` on an asyncio event loop, calling on_result as checks complete.
+
+    `work` yields (resolver, ark, ark_kind, ctx, follow) items, and the throttles
+    are returned by resolver, as for run_threads."""
+    throttles: dict[str, AdaptiveLimit | None] = {}
+    asyncio.run(_run(work, user_agent=user_agent, timeout=timeout, concurrency=concurrency,
+                     per_host=per_host, on_result=on_result, backoff=backoff,
+                     max_retries=max_retries, throttles=throttles))
+    return {resolver: throttle for resolver, throttle in throttles.items() if throttle}
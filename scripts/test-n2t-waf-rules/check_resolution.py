@@ -10,17 +10,28 @@ from __future__ import annotations
 
 import argparse
 import csv
+import heapq
+import http.client
+import itertools
 import json
 import logging
+import os
+import random
+import ssl
+import string
 import sys
+import tempfile
+import threading
 import time
-import urllib.error
 import urllib.parse
-import urllib.request
-from collections import Counter
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import zlib
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Iterable, Iterator
+
+from latency import GROUP_FIELDS, LatencyStats
 
 ENVIRONMENTS = {
     "n2t-production": "https://n2t.net",
@@ -34,6 +45,28 @@ DEFAULT_USER_AGENT = (
 )
 DEFAULT_TIMEOUT = 30
 DEFAULT_WORKERS = 10
+DEFAULT_CONCURRENCY = 500
+DEFAULT_PER_HOST = 20
+MAX_REDIRECTS = 10  # same limit as urllib's HTTPRedirectHandler
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+# Final GET bodies up to this size are drained so the connection can be reused;
+# larger or unsized bodies are dropped by closing the connection instead.
+MAX_DRAIN_BYTES = 64 * 1024
+
+# Block detection and adaptive backoff. A 429 or a connection reset is always
+# treated as rate limiting; a 403 carrying a WAF signature only when at least
+# BURST_RATIO of the last BURST_WINDOW checks to that resolver got one, or when a
+# re-check during such a burst passes, since other WAF 403s are the rule blocks
+# under test (and are not re-checked).
+DEFAULT_MAX_RETRIES = 3
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+BURST_WINDOW = 20
+BURST_RATIO = 0.9
+WAF_HEADERS = ("x-amzn-waf-action", "cf-mitigated")
+WAF_SERVERS = ("awselb", "cloudfront", "cloudflare", "akamaighost")
+WAF_BODY_MARKERS = (b"request blocked", b"access denied", b"attention required",
+                    b"the request could not be satisfied")
 
 logger = logging.getLogger("ark_check")
 
@@ -42,35 +75,324 @@ def build_url(resolver: str, ark: str) -> str:
     return f"{resolver.rstrip('/')}/{urllib.parse.quote(ark, safe='/:%')}"
 
 
-def _request(url: str, *, method: str, user_agent: str, timeout: int) -> tuple[int | None, str | None, str | None]:
-    """Issue one request, following redirects via urllib's default handler.
-
-    Returns (status, final_url, error). status is None on network/transport failure."""
-    req = urllib.request.Request(url, headers={"User-Agent": user_agent}, method=method)
+def redirect_url(url: str, location: str) -> str:
+    """Absolute URL of a redirect's Location, quoted as urllib's HTTPRedirectHandler does
+    (header values are decoded as latin-1, so that round-trips the raw bytes)."""
+    parts = urllib.parse.urlparse(urllib.parse.urljoin(url, location))
+    if not parts.path and parts.netloc:
+        parts = parts._replace(path="/")
+    return urllib.parse.quote(urllib.parse.urlunparse(parts), encoding="iso-8859-1", safe=string.punctuation)
+
+
+class _ResumingHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPSConnection that resumes cached TLS sessions when it reconnects."""
+
+    def __init__(self, host, *, tls_sessions: dict, **kwargs):
+        super().__init__(host, **kwargs)
+        self._tls_sessions = tls_sessions
+
+    def connect(self) -> None:
+        http.client.HTTPConnection.connect(self)
+        self.sock = self._context.wrap_socket(
+            self.sock, server_hostname=self.host, session=self._tls_sessions.get(self.host))
+
+
+class HttpPool:
+    """Keep-alive HTTP(S) connections, one set per worker thread.
+
+    Connections are keyed by (scheme, host:port) so the resolver and common
+    redirect targets (archive.org, ...) are each connected once per worker and
+    reused across checks and redirect hops. TLS sessions are shared between
+    workers per host, so new connections resume instead of doing a full handshake.
+    """
+
+    def __init__(self, *, timeout: int):
+        self.timeout = timeout
+        self._local = threading.local()
+        self._context = ssl.create_default_context()
+        self._tls_sessions: dict[str, ssl.SSLSession] = {}
+        self._all: list[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def _connection(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        conns = getattr(self._local, "conns", None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get((scheme, netloc))
+        if conn is None:
+            if scheme == "https":
+                conn = _ResumingHTTPSConnection(netloc, tls_sessions=self._tls_sessions,
+                                                timeout=self.timeout, context=self._context)
+            else:
+                conn = http.client.HTTPConnection(netloc, timeout=self.timeout)
+            conns[(scheme, netloc)] = conn
+            with self._lock:
+                self._all.append(conn)
+        return conn
+
+    def request(self, method: str, url: str, headers: dict) -> tuple[http.client.HTTPResponse, bytes]:
+        """Send one request (no redirect following); returns (response, body).
+
+        The body is drained (or the connection closed) before returning, so
+        body is only the drained bytes: empty for HEAD, redirects are not
+        kept, and large or unsized bodies are not read."""
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        conn = self._connection(parts.scheme, parts.netloc)
+        reused = conn.sock is not None
+        try:
+            try:
+                conn.request(method, path, headers=headers)
+                resp = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if not reused:
+                    raise
+                # the server closed an idle keep-alive connection; retry once on a fresh one
+                conn.request(method, path, headers=headers)
+                resp = conn.getresponse()
+            body = b""
+            if method == "HEAD" or resp.status in REDIRECT_STATUSES:
+                resp.read()
+            elif resp.length is not None and resp.length <= MAX_DRAIN_BYTES:
+                body = resp.read()
+            else:
+                conn.close()
+        except Exception:
+            conn.close()
+            raise
+        if isinstance(conn.sock, ssl.SSLSocket) and conn.sock.session is not None:
+            self._tls_sessions[conn.host] = conn.sock.session
+        return resp, body
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+
+
+def block_signal(status: int, getheader, body: bytes) -> str | None:
+    """Return "rate_limit" for a 429, "waf" for a 403 with a WAF signature in its
+    headers or body, else None. getheader(name) looks up a response header."""
+    if status == 429:
+        return "rate_limit"
+    if status != 403:
+        return None
+    server = (getheader("server") or "").lower()
+    lowered = body[:4096].lower()
+    if (any(getheader(h) for h in WAF_HEADERS) or any(m in server for m in WAF_SERVERS)
+            or any(m in lowered for m in WAF_BODY_MARKERS)):
+        return "waf"
+    return None
+
+
+def _request(url: str, *, method: str, user_agent: str, pool: HttpPool,
+             follow: bool = True) -> tuple[int | None, str | None, str | None, str | None]:
+    """Issue one request, following up to MAX_REDIRECTS redirects over pooled connections.
+
+    With follow=False only the first response is read and, for a redirect,
+    final_url is its (absolute) Location.
+    Returns (status, final_url, error, block). status is None on network/transport
+    failure; block is block_signal() of the last response, or "reset" if the
+    server dropped the connection."""
+    headers = {"User-Agent": user_agent}
     try:
-        with urllib.request.urlopen(req, timeout=timeout) as resp:
-            return resp.status, resp.url, None
-    except urllib.error.HTTPError as e:
-        final_url = getattr(e, "url", None) or url
-        return e.code, final_url, f"HTTP {e.code}: {e.reason}"
-    except urllib.error.URLError as e:
-        return None, None, f"URLError: {e.reason}"
-    except (TimeoutError, ConnectionError) as e:
-        return None, None, f"{type(e).__name__}: {e}"
+        for _ in range(MAX_REDIRECTS + 1 if follow else 1):
+            resp, body = pool.request(method, url, headers)
+            location = resp.getheader("Location")
+            if resp.status not in REDIRECT_STATUSES or not location:
+                break
+            url = redirect_url(url, location)
+            if not follow:
+                return resp.status, url, None, None
+        else:
+            return resp.status, url, f"HTTP {resp.status}: too many redirects", None
+        if resp.status >= 400:
+            return (resp.status, url, f"HTTP {resp.status}: {resp.reason}",
+                    block_signal(resp.status, resp.getheader, body))
+        if resp.status in REDIRECT_STATUSES and not follow:
+            return resp.status, url, f"HTTP {resp.status}: redirect without Location", None
+        return resp.status, url, None, None
+    except ConnectionError as e:
+        return None, None, f"{type(e).__name__}: {e}", "reset"
     except Exception as e:
-        return None, None, f"{type(e).__name__}: {e}"
+        return None, None, f"{type(e).__name__}: {e}", None
+
+
+def retry_delay(block: str | None, retries: int, max_retries: int,
+                throttled: bool = False) -> float | None:
+    """Seconds to wait before checking an ARK again, or None to keep the result.
+
+    Rate limiting and resets are retried up to max_retries times. A WAF 403 is
+    usually the rule under test, so it is kept, unless the resolver is being
+    throttled (after a 429, a reset or a burst of WAF 403s), when it may be
+    rate limiting too."""
+    if not (block in ("rate_limit", "reset") or (block == "waf" and throttled)):
+        return None
+    if retries >= max_retries:
+        return None
+    return min(MAX_BACKOFF, BASE_BACKOFF * 2 ** retries)
+
+
+class AdaptiveLimit:
+    """Concurrency limit and pause state for one resolver (AIMD with exponential backoff).
+
+    A rate-limit signal halves the limit and pauses new checks for an
+    exponentially growing delay; each run of `limit` clean checks raises the
+    limit by one (until it is back at max_limit) and halves the next delay.
+    Signals from checks already in flight during a pause count as the same
+    episode. Subclasses add waiting."""
+
+    def __init__(self, max_limit: int, name: str):
+        self.name = name
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self.lowest = max_limit
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.delay = 0.0
+        self.trips = 0
+        self._recent: deque = deque(maxlen=BURST_WINDOW)
+        self._clean = 0
+
+    def finished(self, block: str | None, now: float) -> None:
+        self.in_flight -= 1
+        self._recent.append(block == "waf")
+        waf_burst = (block == "waf" and len(self._recent) == BURST_WINDOW
+                     and sum(self._recent) >= BURST_WINDOW * BURST_RATIO)
+        if block in ("rate_limit", "reset") or waf_burst:
+            self._clean = 0
+            if now < self.paused_until:
+                return
+            previous = self.limit
+            self.delay = min(MAX_BACKOFF, self.delay * 2 if self.delay else BASE_BACKOFF)
+            self.limit = max(1, self.limit // 2)
+            self.lowest = min(self.lowest, self.limit)
+            self.paused_until = now + self.delay * random.uniform(1.0, 1.25)
+            self.trips += 1
+            self._recent.clear()
+            logger.warning("%s: %s; pausing %.1fs, concurrency %d -> %d", self.name,
+                           "WAF 403 burst" if waf_burst else block.replace("_", " "),
+                           self.delay, previous, self.limit)
+        elif block is None:
+            self._clean += 1
+            if self._clean >= self.limit:
+                self._clean = 0
+                self.limit = min(self.max_limit, self.limit + 1)
+                self.delay = self.delay / 2 if self.delay > BASE_BACKOFF else 0.0
+
+    @property
+    def throttled(self) -> bool:
+        """True while recovering from rate limiting."""
+        return self.delay > 0
+
+
+class ThreadThrottle(AdaptiveLimit):
+    """AdaptiveLimit shared by the worker threads checking one resolver."""
+
+    def __init__(self, max_limit: int, name: str):
+        super().__init__(max_limit, name)
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    self._cond.wait(self.paused_until - now)
+                elif self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return
+                else:
+                    self._cond.wait()
+
+    def release(self, block: str | None) -> None:
+        with self._cond:
+            self.finished(block, time.monotonic())
+            self._cond.notify_all()
+
+
+def throttle_signal(previous: dict | None, result: dict | None) -> str | None:
+    """The signal a check reports to its throttle: its block, except that a
+    re-check passing after a WAF 403 shows the 403 was rate limiting."""
+    if result is None:
+        return None
+    if previous is not None and previous["block"] == "waf" and result["block"] is None:
+        return "rate_limit"
+    return result["block"]
 
 
 def check_ark(*, resolver: str, ark: str, ark_kind: str, ctx: dict,
-              user_agent: str, timeout: int) -> dict:
-    """Resolve <resolver>/<ark> via HEAD (with GET fallback on 405). Pass = status < 400."""
+              user_agent: str, pool: HttpPool, follow: bool = True, retries: int = 0) -> dict:
+    """Resolve <resolver>/<ark> via HEAD (with GET fallback on 405).
+
+    follow=True: follow redirects to the final target; pass = final status < 400.
+    follow=False: classify the resolver's own response; pass = redirect with Location (or 2xx)."""
     url = build_url(resolver, ark)
     started = time.monotonic()
-    status, final_url, err = _request(url, method="HEAD", user_agent=user_agent, timeout=timeout)
+    status, final_url, err, block = _request(url, method="HEAD", user_agent=user_agent, pool=pool,
+                                             follow=follow)
     if status == 405:
-        status, final_url, err = _request(url, method="GET", user_agent=user_agent, timeout=timeout)
+        status, final_url, err, block = _request(url, method="GET", user_agent=user_agent, pool=pool,
+                                                 follow=follow)
     elapsed_ms = int((time.monotonic() - started) * 1000)
-    ok = status is not None and status < 400
+    return make_result(resolver=resolver, ark=ark, ark_kind=ark_kind, url=url, status=status,
+                       final_url=final_url, elapsed_ms=elapsed_ms, err=err, ctx=ctx, follow=follow,
+                       block=block, retries=retries)
+
+
+def check_with_retries(*, throttle: ThreadThrottle | None, max_retries: int, **kwargs) -> dict:
+    """check_ark under the resolver's throttle, re-checking blocked ARKs with backoff."""
+    retries = 0
+    previous = None
+    while True:
+        result = None
+        if throttle:
+            throttle.acquire()
+        try:
+            result = check_ark(retries=retries, **kwargs)
+        finally:
+            if throttle:
+                throttle.release(throttle_signal(previous, result))
+        delay = retry_delay(result["block"], retries, max_retries,
+                            throttled=throttle is not None and throttle.throttled)
+        if delay is None:
+            return result
+        time.sleep(delay)
+        previous = result
+        retries += 1
+
+
+PASS_OUTCOMES = ("resolved", "redirect")
+
+
+def classify(status: int | None, err: str | None, follow: bool) -> str:
+    """Map a response to an outcome: resolved, redirect, redirect_without_location,
+    blocked (403), not_found (404), rate_limited (429), http_error or transport_error."""
+    if status is None:
+        return "transport_error"
+    if status in REDIRECT_STATUSES:
+        return "redirect" if follow or err is None else "redirect_without_location"
+    if status < 400:
+        return "resolved"
+    if status == 403:
+        return "blocked"
+    if status == 404:
+        return "not_found"
+    if status == 429:
+        return "rate_limited"
+    return "http_error"
+
+
+def make_result(*, resolver: str, ark: str, ark_kind: str, url: str, status: int | None,
+                final_url: str | None, elapsed_ms: int, err: str | None, ctx: dict,
+                follow: bool = True, block: str | None = None, retries: int = 0) -> dict:
+    """Build one SCHEMA result record; shared by the thread and async engines."""
+    outcome = classify(status, err, follow)
+    ok = outcome in PASS_OUTCOMES
     return {
         "ark": ark,
         "ark_kind": ark_kind,
@@ -84,25 +406,96 @@ def check_ark(*, resolver: str, ark: str, ark_kind: str, ctx: dict,
         "naan": ctx.get("naan"),
         "source_method": ctx.get("source_method"),
         "checked_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "mode": "follow" if follow else "resolve",
+        "outcome": outcome,
+        "resolver": resolver,
+        "block": block,
+        "retries": retries,
     }
 
 
-def load_records(path: Path) -> list[dict]:
-    records: list[dict] = []
+# checks queued per resolver beyond those submitted, so a fast resolver can run
+# this far ahead of a slow one instead of moving at its pace
+LANE_BACKLOG = 1000
+
+
+class _Lane:
+    """Worker threads, connections, throttle and queued checks dedicated to one resolver."""
+
+    def __init__(self, resolver: str, *, workers: int, timeout: int, backoff: bool):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="check")
+        self.pool = HttpPool(timeout=timeout)
+        self.throttle = ThreadThrottle(workers, resolver) if backoff else None
+        self.pending: set = set()
+        self.backlog: deque = deque()
+
+    def close(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
+        self.pool.close()
+
+
+def run_threads(work, *, user_agent: str, timeout: int, workers: int, on_result,
+                backoff: bool = True, max_retries: int = DEFAULT_MAX_RETRIES) -> dict[str, AdaptiveLimit]:
+    """Run check_ark over `work` in thread pools, calling on_result as checks complete.
+
+    `work` yields (resolver, ark, ark_kind, ctx, follow) items. Each resolver
+    gets its own `workers` threads, connection pool and (with backoff)
+    ThreadThrottle, so resolvers are checked side by side. At most 2 * workers
+    checks per resolver are submitted at a time and LANE_BACKLOG more queued,
+    so `work` can be a lazy generator of any length; reading it only waits on
+    a resolver whose queue is full, and every resolver is kept busy meanwhile.
+    Returns the throttles by resolver."""
+    lanes: dict[str, _Lane] = {}
+
+    def fill(lane: _Lane) -> None:
+        while lane.backlog and len(lane.pending) < 2 * workers:
+            resolver, ark, kind, ctx, follow = lane.backlog.popleft()
+            lane.pending.add(lane.executor.submit(
+                check_with_retries, throttle=lane.throttle, max_retries=max_retries, resolver=resolver,
+                ark=ark, ark_kind=kind, ctx=ctx, user_agent=user_agent, pool=lane.pool, follow=follow))
+
+    def collect() -> None:
+        """Wait for checks on any resolver to finish, then refill every resolver."""
+        done, _ = wait(set().union(*(lane.pending for lane in lanes.values())), return_when=FIRST_COMPLETED)
+        for lane in lanes.values():
+            lane.pending -= done
+        for fut in done:
+            on_result(fut.result())
+        for lane in lanes.values():
+            fill(lane)
+
+    try:
+        for item in work:
+            lane = lanes.get(item[0])
+            if lane is None:
+                lane = lanes[item[0]] = _Lane(item[0], workers=workers, timeout=timeout, backoff=backoff)
+            lane.backlog.append(item)
+            fill(lane)
+            while len(lane.backlog) >= LANE_BACKLOG:
+                collect()
+        while any(lane.pending for lane in lanes.values()):
+            collect()
+    finally:
+        for lane in lanes.values():
+            lane.close()
+    return {resolver: lane.throttle for resolver, lane in lanes.items() if lane.throttle}
+
+
+def iter_records(path: Path) -> Iterator[dict]:
+    """Parse the JSONL dataset lazily, one record at a time."""
     with path.open("r", encoding="utf-8") as f:
         for line in f:
             line = line.strip()
             if not line:
                 continue
             try:
-                records.append(json.loads(line))
+                yield json.loads(line)
             except json.JSONDecodeError as e:
                 logger.warning("Bad JSONL line: %s", e)
-    return records
 
 
-def build_work(records: list[dict], check: str) -> list[tuple[str, str, dict]]:
-    work: list[tuple[str, str, dict]] = []
+def iter_work(records: Iterable[dict], check: str) -> Iterator[tuple[str, str, dict]]:
+    """Generate (ark, ark_kind, ctx) work items on the fly, skipping repeated ARKs."""
     seen: set[tuple[str, str]] = set()
     for r in records:
         ctx = {k: r.get(k) for k in ("institution", "source_method", "naan")}
@@ -110,37 +503,192 @@ def build_work(records: list[dict], check: str) -> list[tuple[str, str, dict]]:
             ark = r.get("base_ark")
             if isinstance(ark, str) and ark and ("base", ark) not in seen:
                 seen.add(("base", ark))
-                work.append((ark, "base", ctx))
+                yield ark, "base", ctx
         if check in ("full", "both"):
             ark = r.get("full_ark")
             if isinstance(ark, str) and ark and ("full", ark) not in seen:
                 seen.add(("full", ark))
-                work.append((ark, "full", ctx))
-    return work
+                yield ark, "full", ctx
+
+
+def plan_checks(work: Iterable[tuple[str, str, dict]], resolvers: list[str], mode: str,
+                follow_sample: float) -> Iterator[tuple[str, str, str, dict, bool]]:
+    """Expand work items into (resolver, ark, ark_kind, ctx, follow) checks.
+
+    Each ARK is checked against every resolver back to back, so when comparing
+    resolvers all of them see the same ARKs in the same time window. In resolve
+    mode, a deterministic follow_sample fraction of ARKs (by hash, so repeated
+    runs pick the same ones) is also checked with full redirect following."""
+    threshold = int(follow_sample * 10000)
+    for ark, kind, ctx in work:
+        sampled = mode == "resolve" and zlib.crc32(ark.encode("utf-8")) % 10000 < threshold
+        for resolver in resolvers:
+            yield resolver, ark, kind, ctx, mode == "follow"
+            if sampled:
+                yield resolver, ark, kind, ctx, True
 
 
 SCHEMA = [
     "ark", "ark_kind", "request_url", "status", "final_url",
     "elapsed_ms", "ok", "error",
     "institution", "naan", "source_method", "checked_at",
+    "mode", "outcome", "resolver", "block", "retries",
 ]
 
-
-def write_results(jsonl_path: Path, csv_path: Path, results: list[dict]) -> None:
-    with jsonl_path.open("w", encoding="utf-8") as f:
-        for r in results:
-            f.write(json.dumps(r, ensure_ascii=False) + "\n")
-    with csv_path.open("w", encoding="utf-8", newline="") as f:
-        w = csv.DictWriter(f, fieldnames=SCHEMA)
-        w.writeheader()
-        for r in results:
-            w.writerow({k: r.get(k) for k in SCHEMA})
-
-
-def print_summary(resolver: str, env_label: str, results: list[dict]) -> None:
-    total = len(results)
-    passes = sum(1 for r in results if r["ok"])
-    fails = total - passes
+FLUSH_EVERY = 100
+SORT_CHUNK_RECORDS = 100_000
+
+
+def _sort_key(r: dict) -> tuple[str, str]:
+    return r["ark_kind"], r["ark"]
+
+
+class ResultWriter:
+    """Appends each result to the JSONL and CSV outputs as soon as it completes.
+
+    Files are flushed every FLUSH_EVERY results, so an interrupted or crashed
+    run leaves usable (unsorted) output behind."""
+
+    def __init__(self, jsonl_path: Path, csv_path: Path):
+        self.jsonl_path = jsonl_path
+        self.csv_path = csv_path
+        self._jsonl = jsonl_path.open("w", encoding="utf-8")
+        self._csv = csv_path.open("w", encoding="utf-8", newline="")
+        self._csv_writer = csv.DictWriter(self._csv, fieldnames=SCHEMA)
+        self._csv_writer.writeheader()
+        self._pending = 0
+
+    def write(self, r: dict) -> None:
+        self._jsonl.write(json.dumps(r, ensure_ascii=False) + "\n")
+        self._csv_writer.writerow({k: r.get(k) for k in SCHEMA})
+        self._pending += 1
+        if self._pending >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self) -> None:
+        self._jsonl.flush()
+        self._csv.flush()
+        self._pending = 0
+
+    def close(self) -> None:
+        self._jsonl.close()
+        self._csv.close()
+
+
+def sort_results(jsonl_path: Path, csv_path: Path, chunk_records: int = SORT_CHUNK_RECORDS) -> None:
+    """Rewrite both result files sorted by (ark_kind, ark) with an on-disk merge sort.
+
+    The JSONL is read in sorted runs of chunk_records records spilled to
+    temporary files, then merged, so memory is bounded by chunk_records."""
+    runs = []
+    with jsonl_path.open("r", encoding="utf-8") as f:
+        while True:
+            chunk = [json.loads(line) for line in itertools.islice(f, chunk_records) if line.strip()]
+            if not chunk:
+                break
+            chunk.sort(key=_sort_key)
+            run = tempfile.TemporaryFile("w+", encoding="utf-8")
+            run.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in chunk)
+            run.seek(0)
+            runs.append(run)
+    tmp_jsonl = jsonl_path.with_name(jsonl_path.name + ".sorting")
+    tmp_csv = csv_path.with_name(csv_path.name + ".sorting")
+    writer = ResultWriter(tmp_jsonl, tmp_csv)
+    for r in heapq.merge(*((json.loads(line) for line in run) for run in runs), key=_sort_key):
+        writer.write(r)
+    writer.close()
+    for run in runs:
+        run.close()
+    os.replace(tmp_jsonl, jsonl_path)
+    os.replace(tmp_csv, csv_path)
+
+
+class Summary:
+    """Aggregates results as they complete, in memory independent of run size."""
+
+    SAMPLE_FAILURES = 5
+
+    def __init__(self):
+        self.total = 0
+        self.passes = 0
+        self.status_counts: Counter = Counter()
+        self.outcome_counts: Counter = Counter()
+        self.fail_by_inst_kind: Counter = Counter()
+        self.sample_failures: list[dict] = []
+        # final block signal per ARK, and ARKs that passed a re-check after one
+        self.block_counts: Counter = Counter()
+        self.recovered = 0
+        self.latency = LatencyStats()
+
+    def add(self, r: dict) -> None:
+        self.total += 1
+        self.latency.add(r)
+        self.status_counts[(r["status"], r["ok"])] += 1
+        self.outcome_counts[r["outcome"]] += 1
+        if r.get("block"):
+            self.block_counts[r["block"]] += 1
+        elif r.get("retries"):
+            self.recovered += 1
+        if r["ok"]:
+            self.passes += 1
+            return
+        self.fail_by_inst_kind[(r["institution"], r["ark_kind"])] += 1
+        if len(self.sample_failures) < self.SAMPLE_FAILURES:
+            self.sample_failures.append(r)
+
+    @property
+    def fails(self) -> int:
+        return self.total - self.passes
+
+    def as_dict(self, resolver: str, env_label: str) -> dict:
+        return {
+            "resolver": resolver,
+            "env": env_label,
+            "total": self.total,
+            "passes": self.passes,
+            "fails": self.fails,
+            "by_status": [{"status": status, "ok": ok, "count": count}
+                          for (status, ok), count in self.status_counts.most_common()],
+            "by_outcome": dict(self.outcome_counts.most_common()),
+            "blocks": dict(self.block_counts, recovered=self.recovered),
+            "failures_by_institution_kind": [
+                {"institution": inst, "ark_kind": kind, "count": count}
+                for (inst, kind), count in self.fail_by_inst_kind.most_common()],
+            "latency_ms": self.latency.as_dict(),
+        }
+
+
+LATENCY_TOP_GROUPS = 10
+
+
+def print_latency(latency: LatencyStats) -> None:
+    overall = latency.overall.as_dict()
+    if not overall["count"]:
+        return
+    row = "  %-32s n=%-7d p50=%6s  p90=%6s  p99=%6s  max=%6s%s"
+    logger.info("Latency (ms):")
+    logger.info(row, "all", overall["count"], overall["p50"], overall["p90"], overall["p99"],
+                overall["max"], "")
+    slow = {(field, key) for field, key, _ in latency.outliers()}
+    for field in GROUP_FIELDS:
+        sketches = latency.groups[field]
+        if len(sketches) < 2:
+            continue
+        logger.info("  by %s (slowest p90 first):", field)
+        ranked = sorted(sketches.items(), key=lambda kv: -kv[1].quantile(0.9))
+        for key, sketch in ranked[:LATENCY_TOP_GROUPS]:
+            stats = sketch.as_dict()
+            logger.info(row, key, stats["count"], stats["p50"], stats["p90"], stats["p99"],
+                        stats["max"], "  SLOW" if (field, key) in slow else "")
+    for field, key, stats in latency.outliers():
+        logger.warning("Slow %s %s: p90 %sms vs %sms overall (n=%d)", field, key, stats["p90"],
+                       overall["p90"], stats["count"])
+
+
+def print_summary(resolver: str, env_label: str, summary: Summary) -> None:
+    total = summary.total
+    passes = summary.passes
+    fails = summary.fails
     logger.info("=" * 64)
     logger.info("Resolver: %s  (env=%s)", resolver, env_label)
     logger.info("Total: %d  Pass: %d (%.1f%%)  Fail: %d (%.1f%%)",
@@ -148,87 +696,319 @@ def print_summary(resolver: str, env_label: str, results: list[dict]) -> None:
                 100 * passes / total if total else 0.0,
                 fails,
                 100 * fails / total if total else 0.0)
-    status_counts = Counter((r["status"], r["ok"]) for r in results)
     logger.info("By status:")
-    for (status, ok), count in sorted(status_counts.items(), key=lambda x: -x[1]):
+    for (status, ok), count in sorted(summary.status_counts.items(), key=lambda x: -x[1]):
         tag = "PASS" if ok else "FAIL"
         logger.info("  %s  status=%-5s  count=%d", tag, status, count)
+    logger.info("By outcome:")
+    for outcome, count in summary.outcome_counts.most_common():
+        logger.info("  %-26s count=%d", outcome, count)
+    if summary.block_counts or summary.recovered:
+        logger.info("Blocking:")
+        logger.info("  rule-blocked (WAF 403)     count=%d", summary.block_counts["waf"])
+        logger.info("  rate limited (429)         count=%d", summary.block_counts["rate_limit"])
+        logger.info("  connection reset           count=%d", summary.block_counts["reset"])
+        logger.info("  passed after backoff       count=%d", summary.recovered)
+    print_latency(summary.latency)
     if fails:
-        by_inst_kind = Counter((r["institution"], r["ark_kind"]) for r in results if not r["ok"])
         logger.info("Failures by institution + ark_kind:")
-        for (inst, kind), count in by_inst_kind.most_common():
+        for (inst, kind), count in summary.fail_by_inst_kind.most_common():
             logger.info("  %s [%s]: %d", inst, kind, count)
-        sample = [r for r in results if not r["ok"]][:5]
         logger.info("Sample failures:")
-        for r in sample:
+        for r in summary.sample_failures:
             logger.info("  status=%s ark=%s err=%s", r["status"], r["ark"], r["error"])
 
 
+class RunOutput:
+    """Result files and summary for one resolver (or for its follow sample)."""
+
+    def __init__(self, output_dir: Path, label: str, resolver: str):
+        self.label = label
+        self.resolver = resolver
+        self.jsonl_path = output_dir / f"resolution_results_{label}.jsonl"
+        self.csv_path = output_dir / f"resolution_results_{label}.csv"
+        self.summary_path = output_dir / f"resolution_results_{label}_summary.json"
+        self.writer = ResultWriter(self.jsonl_path, self.csv_path)
+        self.summary = Summary()
+
+    def add(self, result: dict) -> None:
+        self.writer.write(result)
+        self.summary.add(result)
+
+    def write_summary(self) -> None:
+        data = self.summary.as_dict(self.resolver, self.label)
+        self.summary_path.write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8")
+
+
+MATRIX_FIELDS = ("status", "outcome", "ok", "elapsed_ms")
+
+
+def _keyed_results(path: Path, index: int) -> Iterator[tuple[tuple[str, str], int, dict]]:
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                r = json.loads(line)
+                yield _sort_key(r), index, r
+
+
+def write_matrix(runs: list[RunOutput], csv_path: Path) -> tuple[int, Counter]:
+    """Join sorted per-resolver result files into one CSV row per (ark_kind, ark).
+
+    Each row has MATRIX_FIELDS per resolver label and `agree` (same outcome
+    everywhere). The files are merged as streams, so memory does not depend on
+    their size. Returns (rows, Counter of outcome tuples for disagreeing rows)."""
+    labels = [run.label for run in runs]
+    fieldnames = ["ark", "ark_kind", "institution", "naan", "agree"] + [
+        f"{field}_{label}" for label in labels for field in MATRIX_FIELDS]
+    disagreements: Counter = Counter()
+    rows = 0
+    merged = heapq.merge(*(_keyed_results(run.jsonl_path, i) for i, run in enumerate(runs)),
+                         key=lambda t: t[0])
+    with csv_path.open("w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for (kind, ark), group in itertools.groupby(merged, key=lambda t: t[0]):
+            row = {"ark": ark, "ark_kind": kind}
+            outcomes = ["missing"] * len(runs)
+            for _, i, r in group:
+                row.setdefault("institution", r.get("institution"))
+                row.setdefault("naan", r.get("naan"))
+                row.update({f"{field}_{labels[i]}": r.get(field) for field in MATRIX_FIELDS})
+                outcomes[i] = r.get("outcome")
+            row["agree"] = len(set(outcomes)) == 1
+            if not row["agree"]:
+                disagreements[tuple(outcomes)] += 1
+            writer.writerow(row)
+            rows += 1
+    return rows, disagreements
+
+
+def print_matrix(labels: list[str], rows: int, disagreements: Counter) -> None:
+    logger.info("=" * 64)
+    logger.info("Matrix: %d ARKs x %d resolvers, %d with differing outcomes",
+                rows, len(labels), sum(disagreements.values()))
+    if disagreements:
+        logger.info("Differing outcomes (%s):", " / ".join(labels))
+        for outcomes, count in disagreements.most_common(10):
+            logger.info("  %s  count=%d", " / ".join(outcomes), count)
+
+
+def parse_envs(value: str) -> list[str]:
+    """Parse --env: one ENVIRONMENTS name, a comma-separated list, or "all"."""
+    if value == "all":
+        return list(ENVIRONMENTS)
+    envs = [env.strip() for env in value.split(",") if env.strip()]
+    unknown = [env for env in envs if env not in ENVIRONMENTS]
+    if not envs or unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown environment {', '.join(unknown) or repr(value)}; choose from "
+            f"{', '.join(ENVIRONMENTS)} or all")
+    return list(dict.fromkeys(envs))
+
+
 def main(argv: list[str] | None = None) -> int:
     parser = argparse.ArgumentParser(description="Check ARK resolution against n2t.")
     here = Path(__file__).resolve().parent
     parser.add_argument("--input", type=Path, default=here / "data" / "ark_spt_sample.jsonl",
                         help="JSONL dataset to check (default: data/ark_spt_sample.jsonl)")
-    parser.add_argument("--env", choices=list(ENVIRONMENTS.keys()), default="n2t-production",
-                        help=f"resolver environment; sets default --resolver. {ENVIRONMENTS}")
+    parser.add_argument("--env", type=parse_envs, default=["n2t-production"],
+                        help=f"resolver environment, a comma-separated list, or 'all' to check every "
+                             f"ARK against each of them side by side. {ENVIRONMENTS}")
     parser.add_argument("--resolver", type=str, default=None,
                         help="resolver URL override; if unset, derived from --env")
+    parser.add_argument("--compare-env", choices=list(ENVIRONMENTS.keys()), default=None,
+                        help="also check every ARK against this environment, interleaved with --env, "
+                             "and write a comparison report")
+    parser.add_argument("--compare-resolver", type=str, default=None,
+                        help="resolver URL to compare against (overrides --compare-env)")
     parser.add_argument("--check", choices=["base", "full", "both"], default="both")
+    parser.add_argument("--mode", choices=["follow", "resolve"], default="follow",
+                        help="follow: follow redirects to the final target; resolve: one request to "
+                             "the resolver, classified on its own response (isolates the WAF)")
+    parser.add_argument("--follow-sample", type=float, default=0.0,
+                        help="resolve mode: fraction of ARKs (0-1) also checked with full redirect "
+                             "following, written to resolution_results_<env>_follow_sample.*")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads",
+                        help="threads: --workers blocking workers; async: one asyncio event loop "
+                             "with up to --concurrency requests in flight")
     parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="async engine: max checks in flight")
+    parser.add_argument("--per-host", type=int, default=DEFAULT_PER_HOST,
+                        help="async engine: max concurrent requests to any one redirect target host "
+                             "(the resolver itself takes up to --concurrency)")
     parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT)
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES,
+                        help="re-checks of an ARK after a 429 or connection reset, with exponential "
+                             "backoff (a WAF 403 only while the resolver is throttled); 0 disables retries")
+    parser.add_argument("--no-backoff", dest="backoff", action="store_false",
+                        help="keep full concurrency when rate limiting is detected")
     parser.add_argument("--user-agent", type=str, default=DEFAULT_USER_AGENT)
     parser.add_argument("--limit", type=int, default=0, help="max records (0 = all)")
     parser.add_argument("--output-dir", type=Path, default=here / "data")
+    parser.add_argument("--no-sort", dest="sort", action="store_false",
+                        help="leave results in completion order instead of sorting them by "
+                             "(ark_kind, ark) after the run")
+    parser.add_argument("--monitor", action="store_true",
+                        help="run continuously, cycling through --input at --rps, and keep rolling "
+                             "1m/15m/1h health windows per resolver in --status-file")
+    parser.add_argument("--rps", type=float, default=2.0,
+                        help="monitor: checks per second, shared by all resolvers (default: 2)")
+    parser.add_argument("--status-file", type=Path, default=None,
+                        help="monitor: status JSON to rewrite (default: <output-dir>/monitor_status.json)")
+    parser.add_argument("--status-interval", type=int, default=30,
+                        help="monitor: seconds between status updates (default: 30)")
+    parser.add_argument("--prometheus-file", type=Path, default=None,
+                        help="monitor: also write metrics here for node_exporter's textfile collector")
+    parser.add_argument("--duration", type=float, default=0,
+                        help="monitor: stop after this many seconds (0 = run until interrupted)")
     parser.add_argument("--log-level", type=str, default="INFO")
     args = parser.parse_args(argv)
 
     logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(message)s")
 
-    resolver = args.resolver or ENVIRONMENTS[args.env]
-    env_label = args.env if not args.resolver else "custom"
-    logger.info("Resolver: %s (env=%s)", resolver, env_label)
+    if args.resolver:
+        if len(args.env) > 1:
+            parser.error("--resolver replaces a single --env")
+        targets = [(args.resolver, "custom")]
+    else:
+        targets = [(ENVIRONMENTS[env], env) for env in args.env]
+    resolver, env_label = targets[0]
+    for target, label in targets:
+        logger.info("Resolver: %s (env=%s)", target, label)
+    if args.compare_env or args.compare_resolver:
+        if len(targets) > 1:
+            parser.error("--compare-env/--compare-resolver take a single --env; "
+                         "use --env a,b to compare more")
+        compare_resolver = args.compare_resolver or ENVIRONMENTS[args.compare_env]
+        compare_label = args.compare_env if not args.compare_resolver else "compare"
+        if compare_resolver == resolver or compare_label == env_label:
+            parser.error("--compare-env/--compare-resolver must differ from --env/--resolver")
+        logger.info("Comparing with: %s (env=%s)", compare_resolver, compare_label)
+        targets.append((compare_resolver, compare_label))
 
     if not args.input.exists():
         logger.error("Input not found: %s", args.input)
         return 2
-    records = load_records(args.input)
+    records = iter_records(args.input)
     if args.limit > 0:
-        records = records[: args.limit]
-    logger.info("Loaded %d records from %s", len(records), args.input)
+        records = itertools.islice(records, args.limit)
+    if args.mode == "follow" and args.follow_sample:
+        parser.error("--follow-sample only applies to --mode resolve")
+    if args.monitor:
+        if args.follow_sample:
+            parser.error("--follow-sample does not apply to --monitor")
+        if args.compare_env or args.compare_resolver:
+            parser.error("--compare-env/--compare-resolver do not apply to --monitor; "
+                         "use --env a,b to monitor several resolvers")
+        if args.engine != "threads":
+            parser.error("--monitor only runs with --engine threads")
+        if not args.backoff or args.max_retries != DEFAULT_MAX_RETRIES:
+            parser.error("--no-backoff and --max-retries do not apply to --monitor, which never retries")
+        if args.rps <= 0 or args.status_interval < 1:
+            parser.error("--rps and --status-interval must be positive")
+        from monitor import run_monitor
+        args.output_dir.mkdir(parents=True, exist_ok=True)
+        return run_monitor(input_path=args.input, check=args.check, mode=args.mode, targets=targets,
+                           user_agent=args.user_agent, timeout=args.timeout, workers=args.workers,
+                           rps=args.rps, status_path=args.status_file or args.output_dir / "monitor_status.json",
+                           status_interval=args.status_interval, prometheus_path=args.prometheus_file,
+                           duration=args.duration, limit=args.limit)
+    work = plan_checks(iter_work(records, args.check), [r for r, _ in targets],
+                       args.mode, args.follow_sample)
+    logger.info("Mode: %s%s", args.mode,
+                f" (follow sample: {args.follow_sample:.1%})" if args.follow_sample else "")
+    if args.engine == "async":
+        logger.info("Streaming ARK checks from %s (engine=async, concurrency=%d, per-host=%d%s)",
+                    args.input, args.concurrency, args.per_host,
+                    " per resolver" if len(targets) > 1 else "")
+    else:
+        logger.info("Streaming ARK checks from %s (workers=%d%s)", args.input, args.workers,
+                    " per resolver" if len(targets) > 1 else "")
 
-    work = build_work(records, args.check)
-    logger.info("Total ARK checks: %d (workers=%d)", len(work), args.workers)
-    if not work:
-        logger.warning("Nothing to check.")
-        return 0
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    # keyed by (resolver, is follow-sample result)
+    outputs: dict[tuple[str, bool], RunOutput] = {}
+    for target, label in targets:
+        outputs[(target, False)] = RunOutput(args.output_dir, label, target)
+        if args.follow_sample:
+            outputs[(target, True)] = RunOutput(args.output_dir, f"{label}_follow_sample", target)
+    primary = [out for (_, sampled), out in outputs.items() if not sampled]
+    done = 0
+
+    def on_result(result: dict) -> None:
+        nonlocal done
+        sampled = args.mode == "resolve" and result["mode"] == "follow"
+        outputs[(result["resolver"], sampled)].add(result)
+        if sampled:
+            return
+        done += 1
+        if done % 100 == 0:
+            logger.info("Progress: %d (%s)", done, ", ".join(
+                f"{out.label} pass: {out.summary.passes}, fail: {out.summary.fails}" for out in primary))
 
-    results: list[dict] = []
     started = time.monotonic()
-    with ThreadPoolExecutor(max_workers=args.workers) as ex:
-        futures = [
-            ex.submit(check_ark, resolver=resolver, ark=ark, ark_kind=kind, ctx=ctx,
-                      user_agent=args.user_agent, timeout=args.timeout)
-            for ark, kind, ctx in work
-        ]
-        for i, fut in enumerate(as_completed(futures), 1):
-            results.append(fut.result())
-            if i % 100 == 0 or i == len(work):
-                pass_count = sum(1 for x in results if x["ok"])
-                logger.info("Progress: %d/%d (pass: %d, fail: %d)",
-                            i, len(work), pass_count, i - pass_count)
+    try:
+        if args.engine == "async":
+            from async_engine import run_async
+            throttles = run_async(work, user_agent=args.user_agent, timeout=args.timeout,
+                                  concurrency=args.concurrency, per_host=args.per_host,
+                                  on_result=on_result, backoff=args.backoff,
+                                  max_retries=args.max_retries)
+        else:
+            throttles = run_threads(work, user_agent=args.user_agent, timeout=args.timeout,
+                                    workers=args.workers, on_result=on_result, backoff=args.backoff,
+                                    max_retries=args.max_retries)
+    except KeyboardInterrupt:
+        for out in outputs.values():
+            out.writer.close()
+            out.write_summary()
+        for out in primary:
+            logger.warning("Interrupted after %d checks; partial results in %s and %s",
+                           out.summary.total, out.jsonl_path, out.csv_path)
+            print_summary(out.resolver, out.label, out.summary)
+        return 130
+    for out in outputs.values():
+        out.writer.close()
     elapsed = time.monotonic() - started
-    logger.info("Completed %d checks in %.1fs", len(results), elapsed)
-
-    results.sort(key=lambda x: (x["ark_kind"], x["ark"]))
-
-    args.output_dir.mkdir(parents=True, exist_ok=True)
-    out_jsonl = args.output_dir / f"resolution_results_{env_label}.jsonl"
-    out_csv = args.output_dir / f"resolution_results_{env_label}.csv"
-    write_results(out_jsonl, out_csv, results)
-    logger.info("Wrote results to %s and %s", out_jsonl, out_csv)
+    logger.info("Completed %d checks in %.1fs", done, elapsed)
+    for throttle in throttles.values():
+        if throttle.trips:
+            logger.warning("%s: backed off %d times for rate limiting; concurrency went down to %d "
+                           "(of %d)", throttle.name, throttle.trips, throttle.lowest, throttle.max_limit)
+    if not done:
+        logger.warning("Nothing to check.")
+        return 0
 
-    print_summary(resolver, env_label, results)
-    return 0 if all(r["ok"] for r in results) else 1
+    for out in outputs.values():
+        if args.sort:
+            sort_results(out.jsonl_path, out.csv_path)
+        out.write_summary()
+        logger.info("Wrote results to %s and %s, summary to %s",
+                    out.jsonl_path, out.csv_path, out.summary_path)
+
+    for (_, sampled), out in outputs.items():
+        if sampled:
+            logger.info("Follow sample (%s, %s):", out.jsonl_path, out.csv_path)
+        print_summary(out.resolver, out.label.replace("_follow_sample", ", follow sample"), out.summary)
+    failed = any(out.summary.fails for out in primary)
+
+    if len(primary) > 1 and args.sort:
+        matrix_path = args.output_dir / "resolution_matrix.csv"
+        rows, disagreements = write_matrix(primary, matrix_path)
+        logger.info("Wrote matrix to %s", matrix_path)
+        print_matrix([out.label for out in primary], rows, disagreements)
+    elif len(primary) > 1:
+        logger.warning("Skipping resolution_matrix.csv: it needs sorted results (no --no-sort)")
+
+    if len(primary) == 2:
+        from compare_results import compare_files, print_comparison
+        a, b = primary
+        comparison, _, _ = compare_files(a.jsonl_path, b.jsonl_path, label_a=a.label,
+                                         label_b=b.label, output_dir=args.output_dir)
+        print_comparison(comparison)
+        failed = failed or bool(comparison.mismatched or comparison.only_a or comparison.only_b)
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""Compare two check_resolution.py result files (e.g. staging vs production).
+
+Joins the two JSONL files on (ark, ark_kind) and reports ARKs whose status,
+outcome or final URL differ, latency deltas by institution and NAAN, and a
+summary. Only file A is indexed, as a hash -> byte offset table; file B is
+streamed and each matching A record is read back from disk, so million-row
+files are compared without loading either into memory. Neither file needs to
+be sorted, so partial output of an interrupted run can be compared too.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import sys
+import urllib.parse
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Iterator
+
+logger = logging.getLogger("ark_compare")
+
+DIFF_SCHEMA = [
+    "ark", "ark_kind", "institution", "naan", "differences",
+    "status_a", "status_b", "outcome_a", "outcome_b", "ok_a", "ok_b",
+    "final_url_a", "final_url_b", "elapsed_ms_a", "elapsed_ms_b", "delta_ms",
+]
+# Fields compared between the two runs, in report order.
+COMPARED_FIELDS = ("status", "outcome", "ok", "final_url")
+TOP_GROUPS = 10
+
+
+def _key_hash(ark: str, ark_kind: str) -> int:
+    digest = hashlib.blake2b(f"{ark_kind}\t{ark}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def _iter_lines(f) -> Iterator[tuple[int, dict]]:
+    """Yield (byte offset, record) for each JSONL line of a binary file."""
+    offset = f.tell()
+    for line in iter(f.readline, b""):
+        if line.strip():
+            try:
+                yield offset, json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning("Bad JSONL line at byte %d: %s", offset, e)
+        offset += len(line)
+
+
+class OffsetIndex:
+    """Hash index of a result file: 64-bit hash of (ark_kind, ark) -> byte offset(s).
+
+    Only integers are held in memory; records are re-read from the file on
+    lookup, and the key is checked so hash collisions cannot mismatch ARKs.
+    If an ARK appears more than once, the first record is used."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = path.open("rb")
+        self._offsets: dict[int, int | list[int]] = {}
+        self.duplicates = 0
+        for offset, r in _iter_lines(self._file):
+            h = _key_hash(r["ark"], r["ark_kind"])
+            existing = self._offsets.get(h)
+            if existing is None:
+                self._offsets[h] = offset
+                continue
+            offsets = existing if isinstance(existing, list) else [existing]
+            if any(self._same_key(o, r["ark"], r["ark_kind"]) for o in offsets):
+                self.duplicates += 1
+            else:
+                self._offsets[h] = offsets + [offset]
+            self._file.seek(offset)
+            self._file.readline()
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def _read(self, offset: int) -> dict:
+        self._file.seek(offset)
+        return json.loads(self._file.readline())
+
+    def pop(self, ark: str, ark_kind: str) -> dict | None:
+        """Return and forget the record for (ark, ark_kind), or None if absent."""
+        h = _key_hash(ark, ark_kind)
+        entry = self._offsets.get(h)
+        if entry is None:
+            return None
+        offsets = entry if isinstance(entry, list) else [entry]
+        for i, offset in enumerate(offsets):
+            r = self._read(offset)
+            if r["ark"] == ark and r["ark_kind"] == ark_kind:
+                rest = offsets[:i] + offsets[i + 1:]
+                if not rest:
+                    del self._offsets[h]
+                else:
+                    self._offsets[h] = rest if len(rest) > 1 else rest[0]
+                return r
+        return None
+
+    def _same_key(self, offset: int, ark: str, ark_kind: str) -> bool:
+        r = self._read(offset)
+        return r["ark"] == ark and r["ark_kind"] == ark_kind
+
+    def remaining(self) -> Iterator[dict]:
+        """Yield the records never popped (present only in this file)."""
+        for entry in self._offsets.values():
+            for offset in entry if isinstance(entry, list) else [entry]:
+                yield self._read(offset)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _relative_url(url: str | None, request_url: str | None) -> str | None:
+    """Strip the resolver origin from URLs on the resolver itself, so that
+    redirects back to the resolver compare equal across environments."""
+    if not url or not request_url:
+        return url
+    origin = urllib.parse.urlsplit(request_url)
+    target = urllib.parse.urlsplit(url)
+    if (target.scheme, target.netloc) == (origin.scheme, origin.netloc):
+        return urllib.parse.urlunsplit(("", "", target.path, target.query, target.fragment))
+    return url
+
+
+def compare_records(a: dict, b: dict) -> dict:
+    """Build one DIFF_SCHEMA record for a pair of results of the same ARK."""
+    values = {
+        "status": (a.get("status"), b.get("status")),
+        "outcome": (a.get("outcome"), b.get("outcome")),
+        "ok": (a.get("ok"), b.get("ok")),
+        "final_url": (_relative_url(a.get("final_url"), a.get("request_url")),
+                      _relative_url(b.get("final_url"), b.get("request_url"))),
+    }
+    differences = [f for f in COMPARED_FIELDS if values[f][0] != values[f][1]]
+    elapsed_a, elapsed_b = a.get("elapsed_ms"), b.get("elapsed_ms")
+    return {
+        "ark": a["ark"],
+        "ark_kind": a["ark_kind"],
+        "institution": a.get("institution") or b.get("institution"),
+        "naan": a.get("naan") or b.get("naan"),
+        "differences": "|".join(differences),
+        "status_a": a.get("status"),
+        "status_b": b.get("status"),
+        "outcome_a": a.get("outcome"),
+        "outcome_b": b.get("outcome"),
+        "ok_a": a.get("ok"),
+        "ok_b": b.get("ok"),
+        "final_url_a": a.get("final_url"),
+        "final_url_b": b.get("final_url"),
+        "elapsed_ms_a": elapsed_a,
+        "elapsed_ms_b": elapsed_b,
+        "delta_ms": elapsed_b - elapsed_a if elapsed_a is not None and elapsed_b is not None else None,
+    }
+
+
+class LatencyDeltas:
+    """Running latency sums for one group (institution or NAAN)."""
+
+    __slots__ = ("count", "sum_a", "sum_b", "slower")
+
+    def __init__(self):
+        self.count = self.sum_a = self.sum_b = self.slower = 0
+
+    def add(self, elapsed_a: int, elapsed_b: int) -> None:
+        self.count += 1
+        self.sum_a += elapsed_a
+        self.sum_b += elapsed_b
+        self.slower += elapsed_b > elapsed_a
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms_a": round(self.sum_a / self.count, 1),
+            "mean_ms_b": round(self.sum_b / self.count, 1),
+            "mean_delta_ms": round((self.sum_b - self.sum_a) / self.count, 1),
+            "b_slower": self.slower,
+        }
+
+
+class Comparison:
+    """Aggregates compared pairs; memory depends on the number of groups, not rows."""
+
+    SAMPLE_DIFFS = 5
+
+    def __init__(self, label_a: str, label_b: str):
+        self.label_a = label_a
+        self.label_b = label_b
+        self.matched = 0
+        self.mismatched = 0
+        self.only_a = 0
+        self.only_b = 0
+        self.field_diffs: Counter = Counter()
+        self.status_pairs: Counter = Counter()
+        self.by_institution: dict[str, LatencyDeltas] = defaultdict(LatencyDeltas)
+        self.by_naan: dict[str, LatencyDeltas] = defaultdict(LatencyDeltas)
+        self.sample_diffs: list[dict] = []
+
+    def add(self, d: dict) -> None:
+        self.matched += 1
+        if d["delta_ms"] is not None:
+            self.by_institution[d["institution"] or "?"].add(d["elapsed_ms_a"], d["elapsed_ms_b"])
+            self.by_naan[d["naan"] or "?"].add(d["elapsed_ms_a"], d["elapsed_ms_b"])
+        if not d["differences"]:
+            return
+        self.mismatched += 1
+        self.field_diffs.update(d["differences"].split("|"))
+        self.status_pairs[(d["status_a"], d["status_b"])] += 1
+        if len(self.sample_diffs) < self.SAMPLE_DIFFS:
+            self.sample_diffs.append(d)
+
+    def as_dict(self) -> dict:
+        def groups(by: dict[str, LatencyDeltas]) -> dict:
+            return {k: v.as_dict() for k, v in sorted(by.items())}
+
+        return {
+            "a": self.label_a,
+            "b": self.label_b,
+            "matched": self.matched,
+            "mismatched": self.mismatched,
+            "only_a": self.only_a,
+            "only_b": self.only_b,
+            "differences": dict(self.field_diffs),
+            "status_pairs": [{"status_a": a, "status_b": b, "count": n}
+                             for (a, b), n in self.status_pairs.most_common()],
+            "latency_by_institution": groups(self.by_institution),
+            "latency_by_naan": groups(self.by_naan),
+        }
+
+
+class DiffWriter:
+    """Writes mismatched pairs (and ARKs present on one side only) as JSONL and CSV."""
+
+    def __init__(self, jsonl_path: Path, csv_path: Path):
+        self._jsonl = jsonl_path.open("w", encoding="utf-8")
+        self._csv = csv_path.open("w", encoding="utf-8", newline="")
+        self._csv_writer = csv.DictWriter(self._csv, fieldnames=DIFF_SCHEMA)
+        self._csv_writer.writeheader()
+
+    def write(self, d: dict) -> None:
+        self._jsonl.write(json.dumps(d, ensure_ascii=False) + "\n")
+        self._csv_writer.writerow(d)
+
+    def close(self) -> None:
+        self._jsonl.close()
+        self._csv.close()
+
+
+def _one_sided(r: dict, side: str) -> dict:
+    d = dict.fromkeys(DIFF_SCHEMA)
+    d.update(ark=r["ark"], ark_kind=r["ark_kind"], institution=r.get("institution"),
+             naan=r.get("naan"), differences=f"only_{side}")
+    for field in ("status", "outcome", "ok", "final_url", "elapsed_ms"):
+        d[f"{field}_{side}"] = r.get(field)
+    return d
+
+
+def compare_files(path_a: Path, path_b: Path, *, label_a: str, label_b: str,
+                  output_dir: Path) -> tuple[Comparison, Path, Path]:
+    """Join two result files on (ark, ark_kind) and write the diff report.
+
+    Returns (comparison, diff_jsonl, diff_csv)."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stem = f"comparison_{label_a}_vs_{label_b}"
+    diff_jsonl = output_dir / f"{stem}.jsonl"
+    diff_csv = output_dir / f"{stem}.csv"
+    comparison = Comparison(label_a, label_b)
+
+    index = OffsetIndex(path_a)
+    logger.info("Indexed %d results from %s", len(index), path_a)
+    writer = DiffWriter(diff_jsonl, diff_csv)
+    try:
+        with path_b.open("rb") as f:
+            for _, b in _iter_lines(f):
+                a = index.pop(b["ark"], b["ark_kind"])
+                if a is None:
+                    comparison.only_b += 1
+                    writer.write(_one_sided(b, "b"))
+                    continue
+                d = compare_records(a, b)
+                comparison.add(d)
+                if d["differences"]:
+                    writer.write(d)
+        for a in index.remaining():
+            comparison.only_a += 1
+            writer.write(_one_sided(a, "a"))
+    finally:
+        writer.close()
+        index.close()
+    if index.duplicates:
+        logger.warning("%d repeated (ark, ark_kind) entries in %s were ignored", index.duplicates, path_a)
+
+    summary_path = output_dir / f"{stem}_summary.json"
+    summary_path.write_text(json.dumps(comparison.as_dict(), indent=2) + "\n", encoding="utf-8")
+    logger.info("Wrote differences to %s and %s, summary to %s", diff_jsonl, diff_csv, summary_path)
+    return comparison, diff_jsonl, diff_csv
+
+
+def print_comparison(comparison: Comparison) -> None:
+    c = comparison
+    logger.info("=" * 64)
+    logger.info("Comparison: A=%s  B=%s", c.label_a, c.label_b)
+    logger.info("Matched: %d  Mismatched: %d (%.1f%%)  Only in A: %d  Only in B: %d",
+                c.matched, c.mismatched, 100 * c.mismatched / c.matched if c.matched else 0.0,
+                c.only_a, c.only_b)
+    if c.mismatched:
+        logger.info("Differences by field:")
+        for field in COMPARED_FIELDS:
+            if c.field_diffs[field]:
+                logger.info("  %-10s count=%d", field, c.field_diffs[field])
+        logger.info("Status changes (A -> B):")
+        for (status_a, status_b), count in c.status_pairs.most_common(TOP_GROUPS):
+            logger.info("  %s -> %s  count=%d", status_a, status_b, count)
+    for title, by in (("institution", c.by_institution), ("NAAN", c.by_naan)):
+        if not by:
+            continue
+        logger.info("Latency delta (B - A) by %s, largest first:", title)
+        ranked = sorted(by.items(), key=lambda kv: -abs(kv[1].sum_b - kv[1].sum_a) / kv[1].count)
+        for name, deltas in ranked[:TOP_GROUPS]:
+            s = deltas.as_dict()
+            logger.info("  %-30s n=%-6d A=%7.0fms  B=%7.0fms  delta=%+7.0fms",
+                        name, s["count"], s["mean_ms_a"], s["mean_ms_b"], s["mean_delta_ms"])
+    if c.sample_diffs:
+        logger.info("Sample differences:")
+        for d in c.sample_diffs:
+            logger.info("  %s [%s] %s: %s -> %s", d["ark"], d["ark_kind"], d["differences"],
+                        d["status_a"], d["status_b"])
+
+
+def _label(path: Path) -> str:
+    name = path.stem
+    return name[len("resolution_results_"):] if name.startswith("resolution_results_") else name
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two check_resolution.py result files.")
+    here = Path(__file__).resolve().parent
+    parser.add_argument("a", type=Path, help="baseline results JSONL (e.g. production)")
+    parser.add_argument("b", type=Path, help="results JSONL to compare against it (e.g. staging)")
+    parser.add_argument("--label-a", type=str, default=None, help="name of A in the report (default: from file name)")
+    parser.add_argument("--label-b", type=str, default=None, help="name of B in the report (default: from file name)")
+    parser.add_argument("--output-dir", type=Path, default=here / "data")
+    parser.add_argument("--log-level", type=str, default="INFO")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(message)s")
+
+    for path in (args.a, args.b):
+        if not path.exists():
+            logger.error("Input not found: %s", path)
+            return 2
+    comparison, _, _ = compare_files(args.a, args.b, label_a=args.label_a or _label(args.a),
+                                     label_b=args.label_b or _label(args.b), output_dir=args.output_dir)
+    print_comparison(comparison)
+    return 0 if not (comparison.mismatched or comparison.only_a or comparison.only_b) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
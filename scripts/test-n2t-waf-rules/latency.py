@@ -0,0 +1,124 @@
+"""Streaming latency percentiles for check_resolution.py summaries.
+
+LatencySketch keeps counts in logarithmically spaced buckets, so any
+quantile is answered within RELATIVE_ACCURACY of the true value while memory
+depends only on the range of latencies (a few hundred buckets for 1ms..10min),
+not on the number of checks. LatencyStats keeps one sketch overall and one per
+naan, institution and ark_kind, and flags groups that are much slower than
+the whole run.
+"""
+
+from __future__ import annotations
+
+import math
+
+RELATIVE_ACCURACY = 0.01
+QUANTILES = (0.5, 0.9, 0.99)
+GROUP_FIELDS = ("naan", "institution", "ark_kind")
+# A group is an outlier when its p90 is OUTLIER_FACTOR times the overall p90,
+# given at least OUTLIER_MIN_COUNT checks in the group.
+OUTLIER_FACTOR = 2.0
+OUTLIER_MIN_COUNT = 20
+
+
+class LatencySketch:
+    """Quantiles of a stream of non-negative values with bounded relative error."""
+
+    __slots__ = ("count", "total", "max", "zeros", "buckets")
+
+    _gamma = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+    _log_gamma = math.log(_gamma)
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.zeros = 0
+        self.buckets: dict[int, int] = {}
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if value <= 0:
+            self.zeros += 1
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other: LatencySketch) -> None:
+        """Add all values of `other` to this sketch."""
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.zeros += other.zeros
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def quantile(self, q: float) -> float | None:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                # midpoint of the bucket (gamma^(i-1), gamma^i] in relative terms
+                return min(self.max, 2 * self._gamma ** index / (self._gamma + 1))
+        return self.max
+
+    def as_dict(self) -> dict:
+        stats = {"count": self.count, "mean": round(self.total / self.count, 1) if self.count else None}
+        for q in QUANTILES:
+            value = self.quantile(q)
+            stats[f"p{round(q * 100)}"] = round(value) if value is not None else None
+        stats["max"] = self.max
+        return stats
+
+
+class LatencyStats:
+    """Latency sketches for a run: overall and per GROUP_FIELDS value."""
+
+    def __init__(self):
+        self.overall = LatencySketch()
+        self.groups: dict[str, dict[str, LatencySketch]] = {field: {} for field in GROUP_FIELDS}
+
+    def add(self, r: dict) -> None:
+        """Add one check result; transport failures (no status) are left out."""
+        if r.get("status") is None or r.get("elapsed_ms") is None:
+            return
+        elapsed = r["elapsed_ms"]
+        self.overall.add(elapsed)
+        for field, sketches in self.groups.items():
+            key = str(r.get(field) or "?")
+            sketch = sketches.get(key)
+            if sketch is None:
+                sketch = sketches[key] = LatencySketch()
+            sketch.add(elapsed)
+
+    def outliers(self) -> list[tuple[str, str, dict]]:
+        """Return (field, value, stats) for groups much slower than the run overall."""
+        overall_p90 = self.overall.quantile(0.9)
+        if not overall_p90:
+            return []
+        found = []
+        for field, sketches in self.groups.items():
+            if len(sketches) < 2:
+                continue
+            for key, sketch in sketches.items():
+                if sketch.count >= OUTLIER_MIN_COUNT and sketch.quantile(0.9) >= OUTLIER_FACTOR * overall_p90:
+                    found.append((field, key, sketch.as_dict()))
+        return found
+
+    def as_dict(self) -> dict:
+        outliers = {(field, key) for field, key, _ in self.outliers()}
+        result = {"overall": self.overall.as_dict()}
+        for field, sketches in self.groups.items():
+            rows = {}
+            for key, sketch in sorted(sketches.items()):
+                rows[key] = sketch.as_dict()
+                rows[key]["outlier"] = (field, key) in outliers
+            result[f"by_{field}"] = rows
+        return result
@@ -0,0 +1,227 @@
+"""Continuous resolution monitoring for check_resolution.py (``--monitor``).
+
+Cycles through the work list forever (re-reading the input each cycle) at a
+fixed --rps budget shared by all resolvers, and keeps rolling 1m/15m/1h
+windows of success rate and latency per resolver. Windows are ring buffers of
+BUCKET_SECONDS buckets, each with a count and a LatencySketch, so memory stays
+constant however long the monitor runs. Every --status-interval seconds the
+windows are written to a JSON status file and, optionally, a Prometheus
+textfile (for node_exporter's textfile collector). No per-check results are
+written.
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator
+
+from check_resolution import HttpPool, check_ark, iter_records, iter_work, logger, plan_checks
+from latency import LatencySketch
+
+WINDOWS = {"1m": 60, "15m": 15 * 60, "1h": 60 * 60}
+BUCKET_SECONDS = 10
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class RollingWindows:
+    """Check counts and latencies over the last hour in fixed-size ring buffers."""
+
+    def __init__(self, bucket_seconds: int = BUCKET_SECONDS, span_seconds: int = max(WINDOWS.values())):
+        self.bucket_seconds = bucket_seconds
+        self._size = span_seconds // bucket_seconds
+        self._epochs = [-1] * self._size
+        self._counts = [0] * self._size
+        self._passes = [0] * self._size
+        self._sketches = [LatencySketch() for _ in range(self._size)]
+
+    def add(self, now: float, ok: bool, elapsed_ms: int | None) -> None:
+        epoch = int(now // self.bucket_seconds)
+        i = epoch % self._size
+        if self._epochs[i] != epoch:
+            self._epochs[i] = epoch
+            self._counts[i] = self._passes[i] = 0
+            self._sketches[i] = LatencySketch()
+        self._counts[i] += 1
+        self._passes[i] += ok
+        if elapsed_ms is not None:
+            self._sketches[i].add(elapsed_ms)
+
+    def stats(self, seconds: int, now: float) -> dict:
+        """Success rate and latency percentiles over the last `seconds`."""
+        last = int(now // self.bucket_seconds)
+        count = passes = 0
+        latency = LatencySketch()
+        for epoch in range(last - seconds // self.bucket_seconds + 1, last + 1):
+            i = epoch % self._size
+            if self._epochs[i] == epoch:
+                count += self._counts[i]
+                passes += self._passes[i]
+                latency.merge(self._sketches[i])
+        stats = latency.as_dict()
+        stats.update(count=count, passes=passes,
+                     success_rate=round(passes / count, 4) if count else None)
+        return stats
+
+
+class ResolverHealth:
+    """Rolling windows and lifetime counters for one resolver."""
+
+    def __init__(self, resolver: str, label: str):
+        self.resolver = resolver
+        self.label = label
+        self.windows = RollingWindows()
+        self.outcomes: Counter = Counter()
+        self.last_failure: dict | None = None
+
+    def add(self, r: dict, now: float) -> None:
+        # checks without a response count against the success rate, not latency
+        self.windows.add(now, r["ok"], r["elapsed_ms"] if r["status"] is not None else None)
+        self.outcomes[r["outcome"]] += 1
+        if not r["ok"]:
+            self.last_failure = {k: r[k] for k in ("ark", "ark_kind", "status", "error", "checked_at")}
+
+    def as_dict(self, now: float) -> dict:
+        return {
+            "resolver": self.resolver,
+            "windows": {name: self.windows.stats(seconds, now) for name, seconds in WINDOWS.items()},
+            "outcomes_total": dict(self.outcomes),
+            "last_failure": self.last_failure,
+        }
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def prometheus_text(health: list[ResolverHealth], now: float) -> str:
+    """Render the windows in the Prometheus text exposition format."""
+    lines = []
+
+    def metric(name: str, kind: str, help_text: str, samples: list[tuple[dict, float]]) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}")
+
+    windows = [(h, name, h.windows.stats(seconds, now)) for h in health for name, seconds in WINDOWS.items()]
+    metric("ark_monitor_checks", "gauge", "ARK checks in the window.",
+           [({"env": h.label, "window": name}, s["count"]) for h, name, s in windows])
+    metric("ark_monitor_success_ratio", "gauge", "Share of ARK checks that passed in the window.",
+           [({"env": h.label, "window": name}, s["success_rate"]) for h, name, s in windows
+            if s["success_rate"] is not None])
+    metric("ark_monitor_latency_ms", "gauge", "ARK check latency percentiles in the window.",
+           [({"env": h.label, "window": name, "quantile": q}, s[key]) for h, name, s in windows
+            for q, key in (("0.5", "p50"), ("0.9", "p90"), ("0.99", "p99")) if s[key] is not None])
+    metric("ark_monitor_checks_total", "counter", "ARK checks since the monitor started, by outcome.",
+           [({"env": h.label, "outcome": outcome}, count) for h in health
+            for outcome, count in sorted(h.outcomes.items())])
+    metric("ark_monitor_last_update_timestamp_seconds", "gauge", "Time of the last status update.",
+           [({}, int(time.time()))])
+    return "\n".join(lines).replace("{}", "") + "\n"
+
+
+def _cycle(input_path: Path, check: str, resolvers: list[str], mode: str,
+           limit: int, counter: list[int]) -> Iterator[tuple]:
+    """Yield work items from the input over and over; counter[0] counts finished cycles."""
+    while True:
+        records = iter_records(input_path)
+        if limit > 0:
+            records = itertools.islice(records, limit)
+        empty = True
+        for item in plan_checks(iter_work(records, check), resolvers, mode, 0.0):
+            empty = False
+            yield item
+        if empty:
+            raise ValueError(f"No ARKs to check in {input_path}")
+        counter[0] += 1
+
+
+def run_monitor(*, input_path: Path, check: str, mode: str, targets: list[tuple[str, str]],
+                user_agent: str, timeout: int, workers: int, rps: float, status_path: Path,
+                status_interval: int, prometheus_path: Path | None, duration: float, limit: int) -> int:
+    """Monitor the resolvers until interrupted (or for `duration` seconds if > 0)."""
+    health = {resolver: ResolverHealth(resolver, label) for resolver, label in targets}
+    started_at = _utc_now()
+    started = time.monotonic()
+    cycles = [0]
+    checks = 0
+    interval = 1.0 / rps
+    pool = HttpPool(timeout=timeout)
+    pending: set = set()
+
+    def collect(done) -> None:
+        nonlocal checks
+        now = time.monotonic()
+        for fut in done:
+            r = fut.result()
+            health[r["resolver"]].add(r, now)
+            checks += 1
+
+    def write_status() -> None:
+        now = time.monotonic()
+        status = {
+            "updated_at": _utc_now(),
+            "started_at": started_at,
+            "rps": rps,
+            "mode": mode,
+            "cycles_completed": cycles[0],
+            "checks": checks,
+            "resolvers": {h.label: h.as_dict(now) for h in health.values()},
+        }
+        _write_atomic(status_path, json.dumps(status, indent=2) + "\n")
+        if prometheus_path:
+            _write_atomic(prometheus_path, prometheus_text(list(health.values()), now))
+        for h in health.values():
+            s = h.windows.stats(WINDOWS["1m"], now)
+            if s["count"]:
+                logger.info("%s 1m: %d checks, %.1f%% ok, p50=%sms p90=%sms",
+                            h.label, s["count"], 100 * s["success_rate"], s["p50"], s["p90"])
+
+    logger.info("Monitoring %d resolver(s) at %.2f checks/s; status in %s every %ds",
+                len(health), rps, status_path, status_interval)
+    next_check = next_status = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for resolver, ark, kind, ctx, follow in _cycle(input_path, check, list(health), mode, limit, cycles):
+            while True:
+                now = time.monotonic()
+                if now >= next_status:
+                    write_status()
+                    next_status = now + status_interval
+                if now >= next_check and len(pending) < workers:
+                    break
+                # with every worker busy only a finished check (or the status update) frees us
+                wake = (min(next_check, next_status) if len(pending) < workers else next_status) - now
+                if pending:
+                    done, pending = wait(pending, timeout=max(0.0, wake), return_when=FIRST_COMPLETED)
+                    collect(done)
+                elif wake > 0:
+                    time.sleep(wake)
+            if duration and now - started >= duration:
+                break
+            # a slow resolver delays checks; don't burst to catch up afterwards
+            next_check = max(next_check + interval, now)
+            pending.add(executor.submit(check_ark, resolver=resolver, ark=ark, ark_kind=kind, ctx=ctx,
+                                        user_agent=user_agent, pool=pool, follow=follow))
+    except KeyboardInterrupt:
+        logger.info("Stopping monitor")
+    finally:
+        executor.shutdown(cancel_futures=True)
+        collect(f for f in pending if f.done() and not f.cancelled())
+        pool.close()
+        write_status()
+    logger.info("Monitor ran %d checks in %d complete cycles", checks, cycles[0])
+    return 0
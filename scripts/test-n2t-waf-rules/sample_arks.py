@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""Build a stratified ARK sample for check_resolution.py from a large corpus.
+
+Reads one or more harvested ARK JSONL files (plain or gzip) in a single
+streaming pass and writes a sample of about --size records in which every
+stratum (by default each naan x institution x suffix_kind x source_method
+combination) has at least --min-per-stratum records, or all of its records
+if it has fewer. The rest of the sample is filled uniformly from the whole
+corpus, so large strata stay proportionally represented.
+
+Each record gets a random key; the sample is the --min-per-stratum smallest
+keys of every stratum plus the smallest keys overall (bottom-k reservoir
+sampling). Only those candidates are kept in memory, never the corpus.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import heapq
+import json
+import logging
+import random
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Iterator, TextIO
+
+DEFAULT_STRATA = ("naan", "institution", "suffix_kind", "source_method")
+DEFAULT_SIZE = 1000
+DEFAULT_MIN_PER_STRATUM = 5
+
+logger = logging.getLogger("ark_sample")
+
+
+def open_corpus(path: Path) -> TextIO:
+    """Open a plain or gzip-compressed JSONL file ("-" for stdin)."""
+    if str(path) == "-":
+        return sys.stdin
+    with path.open("rb") as f:
+        is_gzip = f.read(2) == b"\x1f\x8b"
+    if is_gzip:
+        return gzip.open(path, "rt", encoding="utf-8")
+    return path.open("r", encoding="utf-8")
+
+
+def iter_corpus(paths: list[Path]) -> Iterator[tuple[str, dict]]:
+    """Yield (raw line, record) for every record of the input files, in order."""
+    for path in paths:
+        with open_corpus(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield line, json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.warning("Bad JSONL line in %s: %s", path, e)
+
+
+class _BottomK:
+    """The k entries with the smallest keys seen so far (a max-heap on key)."""
+
+    __slots__ = ("k", "heap")
+
+    def __init__(self, k: int):
+        self.k = k
+        self.heap: list[tuple[float, int, str]] = []
+
+    def offer(self, key: float, seq: int, line: str) -> None:
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, (-key, seq, line))
+        elif -key > self.heap[0][0]:
+            heapq.heapreplace(self.heap, (-key, seq, line))
+
+    def entries(self) -> list[tuple[float, int, str]]:
+        return [(-neg_key, seq, line) for neg_key, seq, line in self.heap]
+
+
+class StratifiedSampler:
+    """One-pass stratified sample with per-stratum minimums.
+
+    add() every record, then sample() returns the selected raw lines in input
+    order. Memory is O(size + strata * min_per_stratum) lines."""
+
+    def __init__(self, *, size: int, min_per_stratum: int, strata: tuple[str, ...],
+                 seed: int | None = None):
+        self.size = size
+        self.min_per_stratum = min_per_stratum
+        self.strata = strata
+        self._rng = random.Random(seed)
+        self._overall = _BottomK(size)
+        self._per_stratum: dict[tuple, _BottomK] = {}
+        self.corpus_counts: Counter = Counter()
+        self.sample_counts: Counter = Counter()
+        self._seq = 0
+
+    def stratum(self, record: dict) -> tuple:
+        return tuple(str(record.get(field) or "") for field in self.strata)
+
+    def add(self, line: str, record: dict) -> None:
+        stratum = self.stratum(record)
+        self.corpus_counts[stratum] += 1
+        key = self._rng.random()
+        seq = self._seq
+        self._seq += 1
+        self._overall.offer(key, seq, line)
+        if self.min_per_stratum:
+            bottom = self._per_stratum.get(stratum)
+            if bottom is None:
+                bottom = self._per_stratum[stratum] = _BottomK(self.min_per_stratum)
+            bottom.offer(key, seq, line)
+
+    def sample(self) -> list[str]:
+        """Return the sampled lines in input order and fill sample_counts."""
+        chosen: dict[int, tuple[str, tuple | None]] = {}
+        for stratum, bottom in self._per_stratum.items():
+            for _, seq, line in bottom.entries():
+                chosen[seq] = (line, stratum)
+        if len(chosen) > self.size:
+            logger.warning("Stratum minimums need %d records, more than --size %d; "
+                           "the sample is larger than requested", len(chosen), self.size)
+        fill = sorted(self._overall.entries())
+        for _, seq, line in fill:
+            if len(chosen) >= self.size:
+                break
+            chosen.setdefault(seq, (line, None))
+        self.sample_counts.clear()
+        lines = []
+        for seq in sorted(chosen):
+            line, stratum = chosen[seq]
+            if stratum is None:
+                stratum = self.stratum(json.loads(line))
+            self.sample_counts[stratum] += 1
+            lines.append(line)
+        return lines
+
+
+def print_strata(sampler: StratifiedSampler) -> None:
+    logger.info("%-60s %10s %8s", " x ".join(sampler.strata), "corpus", "sample")
+    for stratum, count in sampler.corpus_counts.most_common():
+        logger.info("%-60s %10d %8d", " | ".join(stratum), count, sampler.sample_counts[stratum])
+    logger.info("%-60s %10d %8d", f"total ({len(sampler.corpus_counts)} strata)",
+                sum(sampler.corpus_counts.values()), sum(sampler.sample_counts.values()))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Build a stratified ARK sample from harvested corpora.")
+    parser.add_argument("inputs", type=Path, nargs="+",
+                        help="ARK corpus JSONL files, optionally gzip-compressed ('-' for stdin)")
+    parser.add_argument("--output", type=Path, required=True,
+                        help="sample JSONL to write (input for check_resolution.py --input)")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE,
+                        help=f"target number of records (default: {DEFAULT_SIZE})")
+    parser.add_argument("--min-per-stratum", type=int, default=DEFAULT_MIN_PER_STRATUM,
+                        help="records guaranteed from every stratum, or all of a smaller stratum "
+                             f"(default: {DEFAULT_MIN_PER_STRATUM})")
+    parser.add_argument("--strata", type=str, default=",".join(DEFAULT_STRATA),
+                        help=f"comma-separated record fields defining a stratum (default: {','.join(DEFAULT_STRATA)})")
+    parser.add_argument("--seed", type=int, default=None, help="random seed, for a reproducible sample")
+    parser.add_argument("--log-level", type=str, default="INFO")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.size < 1 or args.min_per_stratum < 0:
+        parser.error("--size must be positive and --min-per-stratum not negative")
+    for path in args.inputs:
+        if str(path) != "-" and not path.exists():
+            logger.error("Input not found: %s", path)
+            return 2
+    strata = tuple(field.strip() for field in args.strata.split(",") if field.strip())
+
+    sampler = StratifiedSampler(size=args.size, min_per_stratum=args.min_per_stratum,
+                                strata=strata, seed=args.seed)
+    for line, record in iter_corpus(args.inputs):
+        sampler.add(line, record)
+    lines = sampler.sample()
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    tmp = args.output.with_name(args.output.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.writelines(line + "\n" for line in lines)
+    tmp.replace(args.output)
+    logger.info("Wrote %d of %d records to %s", len(lines), sum(sampler.corpus_counts.values()), args.output)
+    print_strata(sampler)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
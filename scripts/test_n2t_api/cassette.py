@@ -0,0 +1,160 @@
+"""Record/replay of resolver responses for test_n2t_api.py (--record / --replay).
+
+A cassette is a JSONL file: a header line with the recorded base URL, then one
+line per distinct request (method, url, accept, follow) with the response the
+test saw: status, headers, body excerpt and redirect chain. StandIn serves a
+cassette from a local HTTP server, optionally with injected latency, so the
+suite runs offline and its concurrency can be load-tested without touching n2t.
+
+During replay test_n2t_api.py sends every request to the stand-in, passing the
+original request in X-Replay-* headers; redirects are never followed by the
+client, the stand-in returns the recorded final response and chain instead.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import unquote
+
+CASSETTE_VERSION = 1
+URL_HEADER = "X-Replay-URL"
+ACCEPT_HEADER = "X-Replay-Accept"
+FOLLOW_HEADER = "X-Replay-Follow"
+CHAIN_HEADER = "X-Replay-Chain"
+# headers describing the original transfer, not the response; the stand-in sets its own
+_SKIPPED_HEADERS = {"content-length", "transfer-encoding", "content-encoding", "connection", "keep-alive"}
+MISS_STATUS = 502
+
+
+def entry_key(method: str, url: str, accept: Optional[str], follow: bool) -> tuple:
+    return method, url, accept or None, bool(follow)
+
+
+class CassetteWriter:
+    """Append the first response for each distinct request to a cassette file."""
+
+    def __init__(self, path: str, base_url: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._seen: set[tuple] = set()
+        self._f = open(path, "w", encoding="utf-8")
+        header = {"cassette": CASSETTE_VERSION, "base_url": base_url,
+                  "recorded_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")}
+        self._f.write(json.dumps(header) + "\n")
+
+    @property
+    def count(self) -> int:
+        return len(self._seen)
+
+    def record(self, *, method: str, url: str, accept: Optional[str], follow: bool, status: int,
+               headers: dict, body: str, chain: list, elapsed_ms: int) -> None:
+        key = entry_key(method, url, accept, follow)
+        line = json.dumps({"method": method, "url": url, "accept": accept, "follow": follow,
+                           "status": status, "headers": dict(headers), "body": body,
+                           "chain": chain, "elapsed_ms": elapsed_ms})
+        with self._lock:
+            if key in self._seen:
+                return
+            self._seen.add(key)
+            self._f.write(line + "\n")
+
+    def close(self) -> None:
+        self._f.close()
+
+
+def load_cassette(path: str) -> tuple[dict, dict[tuple, dict]]:
+    """Return (header, entries by entry_key) of a cassette file."""
+    with open(path, encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("cassette") != CASSETTE_VERSION:
+            raise ValueError(f"{path} is not a version {CASSETTE_VERSION} cassette")
+        entries = {}
+        for line in f:
+            if line.strip():
+                e = json.loads(line)
+                entries[entry_key(e["method"], e["url"], e["accept"], e["follow"])] = e
+    return header, entries
+
+
+class StandIn:
+    """Local HTTP server answering test requests from cassette entries.
+
+    `latency_ms` is added to every response (with up to `jitter_ms` more, at
+    random); None replays each response's recorded elapsed time instead."""
+
+    def __init__(self, entries: dict[tuple, dict], latency_ms: Optional[float] = 0,
+                 jitter_ms: float = 0):
+        self.entries = entries
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.served = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def delay(self, entry: Optional[dict]) -> float:
+        if self.latency_ms is None:
+            ms = entry["elapsed_ms"] if entry else 0
+        else:
+            ms = self.latency_ms
+        return (ms + random.uniform(0, self.jitter_ms)) / 1000
+
+    def start(self) -> str:
+        """Start serving in a background thread; returns the stand-in's base URL."""
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self._reply(send_body=True)
+
+            def do_HEAD(self):
+                self._reply(send_body=False)
+
+            def _reply(self, send_body: bool) -> None:
+                url = unquote(self.headers.get(URL_HEADER, ""))
+                accept = self.headers.get(ACCEPT_HEADER)
+                follow = self.headers.get(FOLLOW_HEADER) == "1"
+                entry = stand_in.entries.get(entry_key(self.command, url, accept, follow))
+                with stand_in._lock:
+                    stand_in.served += 1
+                    stand_in.misses += entry is None
+                time.sleep(stand_in.delay(entry))
+                if entry is None:
+                    status, headers, body, chain = MISS_STATUS, {}, f"not in cassette: {url}", []
+                else:
+                    status, headers, body, chain = entry["status"], entry["headers"], entry["body"], entry["chain"]
+                data = body.encode("utf-8")
+                self.send_response_only(status)
+                for name, value in headers.items():
+                    if name.lower() not in _SKIPPED_HEADERS:
+                        self.send_header(name, value)
+                if chain:
+                    self.send_header(CHAIN_HEADER, json.dumps(chain))
+                self.send_header("Content-Length", str(len(data) if send_body else 0))
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(data)
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 1024
+
+        self._server = Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
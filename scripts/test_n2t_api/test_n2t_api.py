@@ -2,13 +2,31 @@
 from __future__ import annotations
 
 import argparse
+import collections
+import contextlib
+import csv
 import dataclasses
+import gzip
+import hashlib
+import http.client
+import http.cookiejar
+import itertools
 import json
+import random
 import re
+import socket
+import ssl
+import statistics
 import sys
+import threading
 import time
-from typing import Callable, Optional
-from urllib.parse import urlsplit
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional
+from datetime import datetime, timezone
+from urllib.parse import quote, urlsplit
+from xml.sax.saxutils import escape, quoteattr
+
+import cassette
 
 try:
     import requests
@@ -18,8 +36,17 @@ except ImportError:
 
 
 DEFAULT_TIMEOUT = 15
+DEFAULT_JOBS = 1
 USER_AGENT = "n2t-api-tests/1.0"
 
+BENCH_WARMUP = 1
+BENCH_THRESHOLD = 0.25
+# a slower median is only a regression if it is also this much slower in absolute terms
+BENCH_MIN_DELTA_MS = 20
+PHASES = ("dns_ms", "connect_ms", "tls_ms", "ttfb_ms", "total_ms")
+# latencies sampled per identifier prefix of a corpus run, for its median
+RESERVOIR_SIZE = 1000
+
 IDENTIFIERS = {
     "ark":   "ark:/13030/tf5p30086k",
     "doi":   "doi:10.1000/182",
@@ -35,6 +62,13 @@ IDENTIFIERS = {
 
 INFLECTIONS = ["?", "??", "???", "?info"]
 
+# Fields of a corpus record (JSONL) or row (CSV) that hold identifiers
+CORPUS_FIELDS = ("identifier", "full_ark", "base_ark", "ark")
+CORPUS_NAME_WIDTH = 40
+
+# --report-headers essential: the headers the tests look at
+ESSENTIAL_HEADERS = ("Location", "Content-Type", "Server", "Cache-Control")
+
 ACCEPT_FAMILIES = [
     ("text/html",                 "html"),
     ("application/json",          "json"),
@@ -43,6 +77,13 @@ ACCEPT_FAMILIES = [
     ("application/citeproc+json", "citeproc"),
 ]
 
+# Accept headers with q-values, for the --matrix negotiation cases
+ACCEPT_Q_VARIANTS = [
+    ("application/json;q=0.9, text/html;q=0.1",  "json_over_html"),
+    ("text/html;q=0.5, text/turtle",             "turtle_over_html"),
+    ("application/rdf+xml, text/turtle;q=0.8",   "rdf_over_turtle"),
+]
+
 
 class _CIDict(dict):
     def __init__(self, items):
@@ -71,28 +112,172 @@ class Response:
     body_excerpt: str
     redirect_chain: list
     elapsed_ms: int
+    cached: bool = False
+
+
+class ResponseCache:
+    """Responses of one run keyed by (method, url, accept, follow).
+
+    Concurrent requests for the same key wait for the first one instead of
+    sending their own. Failed requests are not kept."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: dict[tuple, Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def fetch(self, key: tuple, load: Callable[[], Response]) -> Response:
+        with self._lock:
+            fut = self._entries.get(key)
+            owner = fut is None
+            if owner:
+                fut = self._entries[key] = Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+        if not owner:
+            return dataclasses.replace(fut.result(), cached=True)
+        try:
+            fut.set_result(load())
+        except BaseException as e:
+            with self._lock:
+                del self._entries[key]
+            fut.set_exception(e)
+            raise
+        return fut.result()
+
+
+_cache: Optional[ResponseCache] = None
+# requests made by the test running on this thread, while --bench records them
+_recorder = threading.local()
+# --record: where responses are saved; --replay: base URL of the cassette.StandIn
+_cassette: Optional[cassette.CassetteWriter] = None
+_replay_url: Optional[str] = None
+# --per-host: max concurrent requests to one host (0 = no limit)
+_per_host = 0
+_host_slots: dict[str, threading.Semaphore] = {}
+_host_slots_lock = threading.Lock()
+# the keep-alive session shared by all tests; see get_session
+_session: Optional[requests.Session] = None
+
+
+def host_slot(url: str):
+    """Context manager holding one of the --per-host slots of the host of `url`."""
+    if not _per_host:
+        return contextlib.nullcontext()
+    host = urlsplit(url).netloc
+    with _host_slots_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.Semaphore(_per_host)
+    return slot
+
+
+def get_session(pool_size: int = DEFAULT_JOBS) -> requests.Session:
+    """Return the keep-alive session shared by all tests, creating it on first use.
+
+    Connections (and TLS sessions) are reused across tests; up to `pool_size`
+    connections per host are kept, one per concurrent job. Cookies are never
+    stored, so tests don't influence each other."""
+    global _session
+    if _session is None:
+        s = requests.Session()
+        s.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(pool_size, 1))
+        s.mount("http://", adapter)
+        s.mount("https://", adapter)
+        _session = s
+    return _session
 
 
 def http_request(method: str, url: str, *, accept: Optional[str] = None,
-                 timeout: int = DEFAULT_TIMEOUT, follow: bool = False) -> Response:
+                 timeout: Optional[int] = None, follow: bool = False,
+                 cache: bool = True) -> Response:
+    """Send one request; with --cache, identical requests share one response
+    unless `cache` is False."""
+    if _cache is not None and cache:
+        return _cache.fetch((method, url, accept, follow),
+                            lambda: http_request(method, url, accept=accept, timeout=timeout,
+                                                 follow=follow, cache=False))
+    recording = getattr(_recorder, "requests", None)
+    if recording is not None:
+        recording.append((method, url, accept))
     headers = {"User-Agent": USER_AGENT}
     if accept:
         headers["Accept"] = accept
-    t0 = time.time()
-    r = requests.request(method, url, headers=headers,
-                         allow_redirects=follow, timeout=timeout)
-    elapsed = int((time.time() - t0) * 1000)
+    target = url
+    if _replay_url:
+        parts = urlsplit(url)
+        target = _replay_url + url[len(f"{parts.scheme}://{parts.netloc}"):]
+        headers[cassette.URL_HEADER] = quote(url, safe="")
+        headers[cassette.FOLLOW_HEADER] = "1" if follow else "0"
+        if accept:
+            headers[cassette.ACCEPT_HEADER] = accept
+    with host_slot(url):
+        t0 = time.monotonic()
+        r = get_session().request(method, target, headers=headers,
+                                  allow_redirects=follow and not _replay_url,
+                                  timeout=timeout or DEFAULT_TIMEOUT)
+        elapsed = int((time.monotonic() - t0) * 1000)
     chain = [(h.status_code, h.headers.get("Location", "")) for h in r.history]
+    resp_headers = r.headers
+    if _replay_url:
+        resp_headers = {k: v for k, v in r.headers.items() if k != cassette.CHAIN_HEADER}
+        chain = [tuple(hop) for hop in json.loads(r.headers.get(cassette.CHAIN_HEADER, "[]"))]
     body = ""
     if method != "HEAD":
         try:
             body = r.text[:500]
         except Exception:
             body = "<unreadable body>"
-    return Response(url, method, r.status_code, _CIDict(r.headers),
+    if _cassette is not None:
+        _cassette.record(method=method, url=url, accept=accept, follow=follow,
+                         status=r.status_code, headers=resp_headers, body=body,
+                         chain=chain, elapsed_ms=elapsed)
+    return Response(url, method, r.status_code, _CIDict(resp_headers),
                     body, chain, elapsed)
 
 
+def timed_request(method: str, url: str, *, accept: Optional[str] = None,
+                  timeout: Optional[int] = None) -> dict[str, float]:
+    """Send one request on a new connection and time each phase in ms.
+
+    Redirects are not followed: this measures the resolver's own response."""
+    parts = urlsplit(url)
+    tls = parts.scheme == "https"
+    port = parts.port or (443 if tls else 80)
+    timeout = timeout or DEFAULT_TIMEOUT
+    target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    headers = {"Host": parts.netloc, "User-Agent": USER_AGENT, "Connection": "close"}
+    if accept:
+        headers["Accept"] = accept
+    t0 = time.perf_counter()
+    family, kind, proto, _, addr = socket.getaddrinfo(parts.hostname, port,
+                                                      type=socket.SOCK_STREAM)[0]
+    t_dns = time.perf_counter()
+    sock = socket.socket(family, kind, proto)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(addr)
+        t_connect = time.perf_counter()
+        if tls:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parts.hostname)
+        t_tls = time.perf_counter()
+        conn = http.client.HTTPConnection(parts.hostname, port, timeout=timeout)
+        conn.sock = sock
+        conn.request(method, target, headers=headers)
+        resp = conn.getresponse()
+        t_first = time.perf_counter()
+        resp.read()
+        t_end = time.perf_counter()
+    finally:
+        sock.close()
+    return {"dns_ms": (t_dns - t0) * 1000, "connect_ms": (t_connect - t_dns) * 1000,
+            "tls_ms": (t_tls - t_connect) * 1000, "ttfb_ms": (t_first - t_tls) * 1000,
+            "total_ms": (t_end - t0) * 1000}
+
+
 @dataclasses.dataclass
 class Result:
     name: str
@@ -121,8 +306,8 @@ def _build_url(base: str, identifier: str, inflection: str = "") -> str:
     return f"{base.rstrip('/')}/{identifier}{inflection}"
 
 
-def t_resolve(scheme: str, ident: str) -> TestCase:
-    name = f"resolve/{scheme}"
+def t_resolve(scheme: str, ident: str, name: Optional[str] = None) -> TestCase:
+    name = name or f"resolve/{scheme}"
 
     def fn(base: str) -> Result:
         url = _build_url(base, ident)
@@ -165,11 +350,13 @@ def t_inflection(scheme: str, ident: str, inflection: str) -> TestCase:
     return TestCase(name, fn)
 
 
-def t_content_negotiation(scheme: str, ident: str, accept: str, label: str) -> TestCase:
-    name = f"negotiate/{scheme}/{label}"
+def t_content_negotiation(scheme: str, ident: str, accept: str, label: str,
+                          inflection: str = "") -> TestCase:
+    safe_inf = inflection.replace("?", "Q")
+    name = f"negotiate/{scheme}/{safe_inf}/{label}" if inflection else f"negotiate/{scheme}/{label}"
 
     def fn(base: str) -> Result:
-        url = _build_url(base, ident)
+        url = _build_url(base, ident, inflection)
         r = http_request("GET", url, accept=accept, follow=False)
         if r.status not in (200, 301, 302, 303, 307, 308):
             return Result(name, "FAIL", f"Accept={accept} got {r.status}", r)
@@ -275,7 +462,7 @@ def t_idempotency(scheme: str, ident: str) -> TestCase:
     def fn(base: str) -> Result:
         url = _build_url(base, ident)
         a = http_request("GET", url)
-        b = http_request("GET", url)
+        b = http_request("GET", url, cache=False)
         if a.status != b.status:
             return Result(name, "FAIL",
                           f"status differs: {a.status} vs {b.status}", a)
@@ -344,16 +531,22 @@ def t_response_headers(scheme: str, ident: str) -> TestCase:
     return TestCase(name, fn)
 
 
-def all_tests() -> list[TestCase]:
+def all_tests(matrix: bool = False) -> list[TestCase]:
+    """The suite; with `matrix`, inflections and content negotiation are tested
+    for every scheme, and negotiation for every inflection and q-value variant."""
     tests: list[TestCase] = []
     for scheme, ident in IDENTIFIERS.items():
         tests.append(t_resolve(scheme, ident))
-    for scheme in ("ark", "doi"):
+    schemes = list(IDENTIFIERS) if matrix else ["ark", "doi"]
+    for scheme in schemes:
         for inf in INFLECTIONS:
             tests.append(t_inflection(scheme, IDENTIFIERS[scheme], inf))
-    for scheme in ("ark", "doi"):
-        for accept, label in ACCEPT_FAMILIES:
-            tests.append(t_content_negotiation(scheme, IDENTIFIERS[scheme], accept, label))
+    inflections = [""] + INFLECTIONS if matrix else [""]
+    accepts = ACCEPT_FAMILIES + ACCEPT_Q_VARIANTS if matrix else ACCEPT_FAMILIES
+    for scheme in schemes:
+        for inf in inflections:
+            for accept, label in accepts:
+                tests.append(t_content_negotiation(scheme, IDENTIFIERS[scheme], accept, label, inf))
     tests.append(t_suffix_passthrough())
     tests.append(t_hierarchical_fallback())
     for prefix in ("ark", "doi", "urn", "hdl", "pmid"):
@@ -368,6 +561,175 @@ def all_tests() -> list[TestCase]:
     return tests
 
 
+def _p95(values: list[float]) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+
+def bench(tests: list[TestCase], base_url: str, iterations: int,
+          warmup: int = BENCH_WARMUP) -> dict[str, dict]:
+    """Time the requests of each test `iterations` times, one test at a time.
+
+    Each test is run once to find out which requests it makes, those requests
+    are sent `warmup` times untimed, then timed `iterations` times with
+    timed_request. An iteration's time is the sum over the test's requests."""
+    report = {}
+    for t in tests:
+        _recorder.requests = []
+        try:
+            res = t.run(base_url)
+            captured = _recorder.requests
+        finally:
+            _recorder.requests = None
+        if not captured:
+            continue
+        samples, errors = [], 0
+        for i in range(warmup + iterations):
+            sample = dict.fromkeys(PHASES, 0.0)
+            try:
+                for method, url, accept in captured:
+                    for phase, value in timed_request(method, url, accept=accept).items():
+                        sample[phase] += value
+            except (OSError, http.client.HTTPException):
+                errors += i >= warmup
+                continue
+            if i >= warmup:
+                samples.append(sample)
+        entry = {"status": res.status, "requests": len(captured), "n": len(samples),
+                 "errors": errors}
+        if samples:
+            totals = [s["total_ms"] for s in samples]
+            entry["total_ms"] = {"min": round(min(totals), 1),
+                                 "median": round(statistics.median(totals), 1),
+                                 "p95": round(_p95(totals), 1), "max": round(max(totals), 1)}
+            for phase in PHASES[:-1]:
+                entry[phase] = round(statistics.median(s[phase] for s in samples), 1)
+        report[t.name] = entry
+    return report
+
+
+def bench_regressions(report: dict[str, dict], baseline: dict,
+                      threshold: float = BENCH_THRESHOLD) -> dict[str, str]:
+    """Return {test name: reason} for tests whose median is slower than the baseline's."""
+    regressions = {}
+    for name, entry in report.items():
+        base = baseline.get("tests", {}).get(name, {})
+        if "total_ms" not in entry or "total_ms" not in base:
+            continue
+        now, before = entry["total_ms"]["median"], base["total_ms"]["median"]
+        if now > before * (1 + threshold) and now - before >= BENCH_MIN_DELTA_MS:
+            regressions[name] = f"median {now}ms vs baseline {before}ms (+{now / before - 1:.0%})"
+    return regressions
+
+
+def print_bench(report: dict[str, dict], baseline: Optional[dict], regressions: dict[str, str]) -> None:
+    width = max(len(name) for name in report) if report else 4
+    head = f"  {'test':<{width}}  {'n':>3} {'min':>7} {'median':>7} {'p95':>7} {'max':>7}" \
+           f"   {'dns':>6} {'conn':>6} {'tls':>6} {'ttfb':>6}"
+    if baseline:
+        head += f"   {'base':>7} {'delta':>6}"
+    print(head)
+    for name, e in report.items():
+        if "total_ms" not in e:
+            print(f"  {name:<{width}}  all {e['errors']} iterations failed")
+            continue
+        t = e["total_ms"]
+        line = f"  {name:<{width}}  {e['n']:>3} {t['min']:>7} {t['median']:>7} {t['p95']:>7} {t['max']:>7}" \
+               f"   {e['dns_ms']:>6} {e['connect_ms']:>6} {e['tls_ms']:>6} {e['ttfb_ms']:>6}"
+        base = (baseline or {}).get("tests", {}).get(name, {}).get("total_ms")
+        if base:
+            line += f"   {base['median']:>7} {t['median'] / base['median'] - 1:>+6.0%}"
+        if name in regressions:
+            line += "  REGRESSION"
+        print(line)
+    print("\n(times in ms; dns/conn/tls/ttfb are medians)")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s):")
+        for name, reason in regressions.items():
+            print(f"  - {name}: {reason}")
+
+
+def iter_corpus(path: str) -> Iterator[str]:
+    """Yield identifiers from a JSONL or CSV corpus (optionally gzipped), lazily.
+
+    Every distinct non-empty CORPUS_FIELDS value of a record is yielded, so an
+    ARK sample record gives both its base and full ARK."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", newline="") as f:
+        if path.removesuffix(".gz").endswith(".csv"):
+            rows: Iterable[dict] = csv.DictReader(f)
+        else:
+            rows = _jsonl_rows(f, path)
+        for row in rows:
+            seen = set()
+            for field in CORPUS_FIELDS:
+                value = (row.get(field) or "").strip()
+                if value and value not in seen:
+                    seen.add(value)
+                    yield value
+
+
+def _jsonl_rows(lines: Iterable[str], path: str) -> Iterator[dict]:
+    for n, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            print(f"{path}:{n}: skipping bad JSON line: {e}", file=sys.stderr)
+            continue
+        if isinstance(row, dict):
+            yield row
+
+
+def id_prefix(ident: str) -> str:
+    """Group key of an identifier: ark:/<NAAN>, doi:<prefix>, or its scheme."""
+    scheme, _, rest = ident.partition(":")
+    scheme = scheme.lower()
+    if scheme == "ark":
+        return f"ark:/{rest.lstrip('/').split('/', 1)[0]}"
+    if scheme == "doi":
+        return f"doi:{rest.split('/', 1)[0]}"
+    return scheme
+
+
+def _sample_key(ident: str) -> float:
+    """A stable pseudo-random number in [0, 1) for `ident`."""
+    return int.from_bytes(hashlib.blake2b(ident.encode(), digest_size=8).digest(), "big") / 2 ** 64
+
+
+def corpus_tests(path: str, sample: float = 1.0, limit: int = 0) -> Iterator[TestCase]:
+    """Generate a resolve test per corpus identifier, named corpus/<identifier>.
+
+    `sample` keeps that fraction of identifiers, chosen by hash so repeated runs
+    test the same ones; `limit` stops after that many tests (0 = no limit)."""
+    made = 0
+    for ident in iter_corpus(path):
+        if sample < 1 and _sample_key(ident) >= sample:
+            continue
+        yield t_resolve(ident.partition(":")[0].lower(), ident, name=f"corpus/{ident}")
+        made += 1
+        if made == limit:
+            return
+
+
+def print_prefix_summary(summary: dict[str, dict]) -> None:
+    width = max(len(prefix) for prefix in summary)
+    print(f"\n  {'prefix':<{width}}  {'pass':>6} {'fail':>6} {'skip':>6} {'median':>8}")
+    for prefix, row in sorted(summary.items(), key=lambda item: -sum(item[1][k] for k in ("pass", "fail", "skip"))):
+        median = f"{row['median_ms']:.0f}ms" if row["median_ms"] is not None else "-"
+        print(f"  {prefix:<{width}}  {row['pass']:>6} {row['fail']:>6} {row['skip']:>6} {median:>8}")
+
+
+def print_matrix(rows: dict[str, dict[str, str]]) -> None:
+    columns = list(dict.fromkeys(col for row in rows.values() for col in row))
+    width = max(len(row) for row in rows)
+    widths = [max(len(col), 4) for col in columns]
+    print(f"\n  {'negotiate':<{width}}  " + " ".join(f"{c:>{w}}" for c, w in zip(columns, widths)))
+    for name, row in rows.items():
+        print(f"  {name:<{width}}  " + " ".join(f"{row.get(c, ''):>{w}}" for c, w in zip(columns, widths)))
+
+
 COLOR = {
     "PASS":  "\033[32m",
     "FAIL":  "\033[31m",
@@ -382,17 +744,221 @@ def fmt(status: str, use_color: bool) -> str:
     return f"{COLOR.get(status, '')}{status}{COLOR['RESET']}"
 
 
-def run(tests: list[TestCase], base_url: str, verbose: bool, use_color: bool) -> list[Result]:
-    results = []
-    width = max(len(t.name) for t in tests)
-    for t in tests:
-        res = t.run(base_url)
-        results.append(res)
+def execute(tests: Iterable[TestCase], base_url: str,
+            jobs: int = DEFAULT_JOBS) -> Iterator[tuple[TestCase, Result]]:
+    """Run tests, yielding (test, result) in test order.
+
+    With jobs > 1 up to that many tests run at once; the requests within one
+    test (idempotency and HEAD-vs-GET pairs) are still made one after another.
+    Tests are taken from `tests` only a few jobs ahead of the output, so a
+    generated test list is never held in memory."""
+    if jobs <= 1:
+        for t in tests:
+            yield t, t.run(base_url)
+        return
+    pool = ThreadPoolExecutor(max_workers=jobs)
+    pending: collections.deque = collections.deque()
+    try:
+        for t in tests:
+            pending.append((t, pool.submit(t.run, base_url)))
+            if len(pending) >= 2 * jobs:
+                done, f = pending.popleft()
+                yield done, f.result()
+        while pending:
+            done, f = pending.popleft()
+            yield done, f.result()
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+class LatencyReservoir:
+    """A uniform random sample of at most RESERVOIR_SIZE latencies (reservoir
+    sampling), so a prefix's median costs the same memory for any corpus size."""
+
+    def __init__(self):
+        self.count = 0
+        self.sample: list[int] = []
+        self._random = random.Random(0)
+
+    def add(self, ms: int) -> None:
+        self.count += 1
+        if len(self.sample) < RESERVOIR_SIZE:
+            self.sample.append(ms)
+        else:
+            i = self._random.randrange(self.count)
+            if i < RESERVOIR_SIZE:
+                self.sample[i] = ms
+
+    def median(self) -> Optional[float]:
+        return statistics.median(self.sample) if self.sample else None
+
+
+class Tally:
+    """What the end-of-run summaries need from the results, without keeping them."""
+
+    def __init__(self):
+        self.counts: collections.Counter = collections.Counter()
+        self.failures: list[tuple[str, str]] = []
+        self._prefix_counts: dict[str, collections.Counter] = collections.defaultdict(collections.Counter)
+        self._prefix_elapsed: dict[str, LatencyReservoir] = collections.defaultdict(LatencyReservoir)
+        # {scheme[/inflection]: {accept label: status code, "!" appended on failure}}
+        self.matrix: dict[str, dict[str, str]] = {}
+
+    def add(self, r: Result) -> None:
+        self.counts[r.status] += 1
+        if r.status == "FAIL":
+            self.failures.append((r.name, r.detail))
+        parts = r.name.split("/")
+        if parts[0] == "corpus":
+            prefix = id_prefix(r.name.split("/", 1)[1])
+            self._prefix_counts[prefix][r.status] += 1
+            if r.response is not None:
+                self._prefix_elapsed[prefix].add(r.response.elapsed_ms)
+        elif parts[0] == "negotiate":
+            cell = str(r.response.status) if r.response is not None else "-"
+            if r.status == "FAIL":
+                cell += "!"
+            self.matrix.setdefault("/".join(parts[1:-1]), {})[parts[-1]] = cell
+
+    def summary(self) -> tuple[int, int, int]:
+        return self.counts["PASS"], self.counts["FAIL"], self.counts["SKIP"]
+
+    def prefix_summary(self) -> dict[str, dict]:
+        """Pass/fail/skip counts and (approximate) median latency per identifier prefix of corpus tests."""
+        summary = {}
+        for prefix, counts in sorted(self._prefix_counts.items()):
+            median = self._prefix_elapsed[prefix].median()
+            summary[prefix] = {"pass": counts["PASS"], "fail": counts["FAIL"], "skip": counts["SKIP"],
+                               "median_ms": round(median) if median is not None else None}
+        return summary
+
+
+def response_record(r: Optional[Response], body_limit: int = 500,
+                    headers: str = "all") -> Optional[dict]:
+    """A response as a JSON-able dict, with the body cut to `body_limit` characters
+    and the headers "all", "essential" (ESSENTIAL_HEADERS) or "none"."""
+    if r is None:
+        return None
+    record = dataclasses.asdict(r)
+    record["body_excerpt"] = r.body_excerpt[:body_limit]
+    if headers == "none":
+        del record["headers"]
+    elif headers == "essential":
+        record["headers"] = {k: r.headers[k] for k in ESSENTIAL_HEADERS if k in r.headers}
+    return record
+
+
+class JsonReporter:
+    """--json: one JSON document with every result, written when the run ends."""
+
+    def __init__(self, stream, base_url: str, **trim):
+        self.stream = stream
+        self.base_url = base_url
+        self.trim = trim
+        self.results: list[dict] = []
+
+    def add(self, r: Result) -> None:
+        self.results.append({"name": r.name, "status": r.status, "detail": r.detail,
+                             "response": response_record(r.response, **self.trim)})
+
+    def close(self, tally: Tally) -> None:
+        out = {
+            "base_url": self.base_url,
+            "summary": dict(zip(("pass", "fail", "skip"), tally.summary())),
+            "by_prefix": tally.prefix_summary() or None,
+            "negotiation_matrix": tally.matrix,
+            "results": self.results,
+        }
+        json.dump(out, self.stream, indent=2)
+        self.stream.write("\n")
+
+
+class JsonlReporter:
+    """--jsonl: one JSON line per result, written as soon as it is known."""
+
+    def __init__(self, stream, **trim):
+        self.stream = stream
+        self.trim = trim
+
+    def add(self, r: Result) -> None:
+        self.stream.write(json.dumps({"name": r.name, "status": r.status, "detail": r.detail,
+                                      "response": response_record(r.response, **self.trim)}) + "\n")
+        self.stream.flush()
+
+    def close(self, tally: Tally) -> None:
+        passed, failed, skipped = tally.summary()
+        self.stream.write(json.dumps({"summary": {"pass": passed, "fail": failed, "skip": skipped}}) + "\n")
+        self.stream.flush()
+
+
+# characters not allowed in XML 1.0
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+def _xml(text: str) -> str:
+    return escape(_XML_INVALID.sub("?", text))
+
+
+class JUnitReporter:
+    """--junit: JUnit XML with one <testcase> per result, written as results come in.
+
+    The totals are not known until the end, so the <testsuite> element has no
+    tests/failures/skipped attributes; CI tools count the test cases."""
+
+    def __init__(self, stream, base_url: str, **trim):
+        self.stream = stream
+        self.trim = trim
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+        stream.write('<?xml version="1.0" encoding="UTF-8"?>\n<testsuites>\n'
+                     f'  <testsuite name="n2t-api" hostname={quoteattr(base_url)} timestamp="{timestamp}">\n')
+        stream.flush()
+
+    def add(self, r: Result) -> None:
+        seconds = r.response.elapsed_ms / 1000 if r.response is not None else 0
+        lines = [f'    <testcase classname={quoteattr("n2t." + r.name.split("/", 1)[0])} '
+                 f'name={quoteattr(r.name)} time="{seconds:.3f}">']
+        if r.status == "FAIL":
+            lines.append(f"      <failure message={quoteattr(_XML_INVALID.sub('?', r.detail))}/>")
+        elif r.status == "SKIP":
+            lines.append(f"      <skipped message={quoteattr(_XML_INVALID.sub('?', r.detail))}/>")
+        record = response_record(r.response, **self.trim)
+        if record is not None:
+            out = [f"{record['method']} {record['url']} -> {record['status']} ({record['elapsed_ms']}ms)"]
+            out += [f"{k}: {v}" for k, v in record.get("headers", {}).items()]
+            if record["redirect_chain"]:
+                out.append(f"chain: {record['redirect_chain']}")
+            if record["body_excerpt"]:
+                out.append(record["body_excerpt"])
+            lines.append(f"      <system-out>{_xml(chr(10).join(out))}</system-out>")
+        lines.append("    </testcase>")
+        self.stream.write("\n".join(lines) + "\n")
+        self.stream.flush()
+
+    def close(self, tally: Tally) -> None:
+        self.stream.write("  </testsuite>\n</testsuites>\n")
+        self.stream.flush()
+
+
+def run(tests: Iterable[TestCase], base_url: str, verbose: bool, use_color: bool,
+        jobs: int = DEFAULT_JOBS, width: Optional[int] = None, reporters: Iterable = (),
+        quiet: bool = False) -> Tally:
+    """Run the tests, printing each result unless `quiet` and passing it to the reporters."""
+    tally = Tally()
+    if width is None:
+        tests = list(tests)
+        width = max(len(t.name) for t in tests)
+    for t, res in execute(tests, base_url, jobs):
+        tally.add(res)
+        for reporter in reporters:
+            reporter.add(res)
+        if quiet:
+            continue
         print(f"  {fmt(res.status, use_color):>4}  {t.name:<{width}}  {res.detail}")
         if verbose and res.response is not None:
             r = res.response
             print(f"        url: {r.url}")
-            print(f"        status: {r.status}  elapsed: {r.elapsed_ms}ms")
+            print(f"        status: {r.status}  elapsed: {r.elapsed_ms}ms"
+                  f"{'  (cached)' if r.cached else ''}")
             for k, v in r.headers.items():
                 print(f"        {k}: {v}")
             if r.redirect_chain:
@@ -400,70 +966,218 @@ def run(tests: list[TestCase], base_url: str, verbose: bool, use_color: bool) ->
             if r.body_excerpt:
                 excerpt = r.body_excerpt.replace("\n", " ")[:200]
                 print(f"        body: {excerpt!r}")
-    return results
-
-
-def summarize(results: list[Result]) -> tuple[int, int, int]:
-    passed = sum(1 for r in results if r.status == "PASS")
-    failed = sum(1 for r in results if r.status == "FAIL")
-    skipped = sum(1 for r in results if r.status == "SKIP")
-    return passed, failed, skipped
+    return tally
 
 
 def main() -> int:
-    global DEFAULT_TIMEOUT
+    global DEFAULT_TIMEOUT, _cache, _cassette, _replay_url, _per_host
     p = argparse.ArgumentParser(description="Test the N2T resolver API.")
-    p.add_argument("--base-url", required=True,
-                   help="N2T base URL, e.g. https://n2t.net or https://n2t-stg.n2t.net")
+    p.add_argument("--base-url", default=None,
+                   help="N2T base URL, e.g. https://n2t.net or https://n2t-stg.n2t.net "
+                        "(required unless --replay)")
     p.add_argument("--filter", default=None, help="Regex to select test names.")
     p.add_argument("--verbose", action="store_true")
     p.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT)
+    p.add_argument("--corpus", default=None,
+                   help="JSONL or CSV file of identifiers to test for resolution instead of "
+                        "the built-in suite (optionally gzipped).")
+    p.add_argument("--sample", type=float, default=1.0,
+                   help="Fraction of --corpus identifiers to test, chosen reproducibly (default 1).")
+    p.add_argument("--limit", type=int, default=0,
+                   help="Test at most N --corpus identifiers (0 = all).")
+    p.add_argument("--matrix", action="store_true",
+                   help="Test inflections and content negotiation for every scheme, inflection "
+                        "and Accept variant (several hundred cases; use with --jobs).")
+    p.add_argument("--per-host", type=int, default=0,
+                   help="Max concurrent requests to any one host (default: no limit beyond --jobs).")
+    p.add_argument("--cache", action="store_true",
+                   help="Send identical requests once per run and share the response.")
+    p.add_argument("--jobs", type=int, default=DEFAULT_JOBS,
+                   help="Run up to N tests concurrently (default 1).")
+    p.add_argument("--bench", type=int, default=0, metavar="N",
+                   help="Benchmark: time each test's requests N times instead of reporting pass/fail.")
+    p.add_argument("--warmup", type=int, default=BENCH_WARMUP,
+                   help=f"Untimed rounds before --bench timing (default {BENCH_WARMUP}).")
+    p.add_argument("--baseline", default=None,
+                   help="Benchmark JSON from an earlier --bench-output run to compare against.")
+    p.add_argument("--bench-output", default=None,
+                   help="Write the benchmark JSON here (to use as a later --baseline).")
+    p.add_argument("--threshold", type=float, default=BENCH_THRESHOLD,
+                   help=f"Fail when a test's median is this fraction slower than the baseline "
+                        f"(default {BENCH_THRESHOLD}).")
+    p.add_argument("--jsonl", default=None, metavar="FILE",
+                   help="Stream one JSON line per result to FILE ('-' for stdout) as tests finish.")
+    p.add_argument("--junit", default=None, metavar="FILE",
+                   help="Stream JUnit XML results to FILE ('-' for stdout) as tests finish.")
+    p.add_argument("--report-body", type=int, default=500, metavar="N",
+                   help="Body excerpt characters in --json/--jsonl/--junit output (default 500).")
+    p.add_argument("--report-headers", choices=["all", "essential", "none"], default="all",
+                   help="Response headers in --json/--jsonl/--junit output (default all).")
+    p.add_argument("--record", default=None, metavar="CASSETTE",
+                   help="Save every response to this cassette file for --replay.")
+    p.add_argument("--replay", default=None, metavar="CASSETTE",
+                   help="Answer requests from a recorded cassette via a local stand-in server.")
+    p.add_argument("--replay-latency", default="0",
+                   help="Stand-in latency per response in ms, or 'recorded' to replay the "
+                        "recorded times (default 0).")
+    p.add_argument("--replay-jitter", type=float, default=0,
+                   help="Up to this many random extra ms of stand-in latency (default 0).")
     p.add_argument("--json", action="store_true",
                    help="Emit JSON results to stdout.")
     p.add_argument("--no-color", action="store_true")
     args = p.parse_args()
     DEFAULT_TIMEOUT = args.timeout
-
-    tests = all_tests()
+    if args.jobs < 1 or args.per_host < 0:
+        p.error("--jobs must be at least 1 and --per-host not negative")
+    _per_host = args.per_host
+    get_session(args.jobs)
+    if args.cache:
+        if args.bench:
+            p.error("--cache cannot be combined with --bench")
+        _cache = ResponseCache()
+    if args.record and args.replay:
+        p.error("--record and --replay are exclusive")
+    if args.bench and (args.record or args.replay):
+        p.error("--bench measures the live resolver; it cannot be combined with --record/--replay")
+    if args.replay:
+        if args.replay_latency == "recorded":
+            latency = None
+        else:
+            try:
+                latency = float(args.replay_latency)
+            except ValueError:
+                p.error("--replay-latency must be a number of ms or 'recorded'")
+        try:
+            header, entries = cassette.load_cassette(args.replay)
+        except (OSError, ValueError) as e:
+            print(f"Cannot load cassette: {e}", file=sys.stderr)
+            return 2
+        args.base_url = args.base_url or header["base_url"]
+        stand_in = cassette.StandIn(entries, latency, args.replay_jitter)
+        _replay_url = stand_in.start()
+        print(f"Replaying {len(entries)} responses recorded from {header['base_url']} "
+              f"at {header['recorded_at']}", file=sys.stderr)
+    elif not args.base_url:
+        p.error("--base-url is required unless --replay is given")
+    if args.record:
+        _cassette = cassette.CassetteWriter(args.record, args.base_url)
+    try:
+        return run_suite(p, args)
+    finally:
+        if _cassette is not None:
+            _cassette.close()
+            print(f"Recorded {_cassette.count} responses to {args.record}", file=sys.stderr)
+        if _replay_url:
+            stand_in.stop()
+            if stand_in.misses:
+                print(f"{stand_in.misses} of {stand_in.served} requests were not in the cassette "
+                      f"(answered {cassette.MISS_STATUS})", file=sys.stderr)
+
+
+def run_suite(p: argparse.ArgumentParser, args: argparse.Namespace) -> int:
+    if args.corpus:
+        if not 0 < args.sample <= 1:
+            p.error("--sample must be in (0, 1]")
+        tests: Iterable[TestCase] = corpus_tests(args.corpus, args.sample, args.limit)
+        width = CORPUS_NAME_WIDTH
+    else:
+        tests = all_tests(args.matrix)
     if args.filter:
         rx = re.compile(args.filter)
-        tests = [t for t in tests if rx.search(t.name)]
-        if not tests:
-            print(f"No tests matched filter {args.filter!r}", file=sys.stderr)
-            return 2
+        tests = (t for t in tests if rx.search(t.name))
+    if args.corpus:
+        source = f"corpus {args.corpus}"
+    else:
+        tests = list(tests)
+        source = f"{len(tests)} tests"
+        width = max((len(t.name) for t in tests), default=0)
+    tests = iter(tests)
+    try:
+        first = next(tests)
+    except FileNotFoundError as e:
+        print(f"Corpus not found: {e.filename}", file=sys.stderr)
+        return 2
+    except StopIteration:
+        print(f"No tests matched filter {args.filter!r}" if args.filter else "No tests in corpus",
+              file=sys.stderr)
+        return 2
+    tests = itertools.chain([first], tests)
+
+    if args.bench:
+        return run_bench(args, list(tests))
+
+    outputs = [path for path in (args.jsonl, args.junit) if path == "-"] + ["-"] * args.json
+    if len(outputs) > 1:
+        p.error("only one of --json, --jsonl - and --junit - can write to stdout")
+    quiet = bool(outputs)
+    use_color = sys.stdout.isatty() and not args.no_color and not quiet
+    trim = {"body_limit": args.report_body, "headers": args.report_headers}
+
+    with contextlib.ExitStack() as stack:
+        def open_output(path: str):
+            if path == "-":
+                return sys.stdout
+            return stack.enter_context(open(path, "w", encoding="utf-8"))
+
+        reporters = []
+        if args.json:
+            reporters.append(JsonReporter(sys.stdout, args.base_url, **trim))
+        if args.jsonl:
+            reporters.append(JsonlReporter(open_output(args.jsonl), **trim))
+        if args.junit:
+            reporters.append(JUnitReporter(open_output(args.junit), args.base_url, **trim))
+
+        if not quiet:
+            print(f"Running {source} against {args.base_url}\n")
+        tally = run(tests, args.base_url, args.verbose, use_color, args.jobs, width,
+                    reporters=reporters, quiet=quiet)
+        for reporter in reporters:
+            reporter.close(tally)
+
+    passed, failed, skipped = tally.summary()
+    if not quiet:
+        if args.corpus:
+            print_prefix_summary(tally.prefix_summary())
+        if tally.matrix:
+            print_matrix(tally.matrix)
+        print(f"\n{passed} passed, {failed} failed, {skipped} skipped")
+        if _cache is not None:
+            print(f"{_cache.misses} requests sent, {_cache.hits} answered from cache")
+        if failed:
+            print("\nFailures:")
+            for name, detail in tally.failures:
+                print(f"  - {name}: {detail}")
+    return 0 if failed == 0 else 1
 
-    use_color = sys.stdout.isatty() and not args.no_color and not args.json
 
+def run_bench(args: argparse.Namespace, tests: list[TestCase]) -> int:
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    if not args.json:
+        print(f"Benchmarking {len(tests)} tests against {args.base_url} "
+              f"({args.warmup} warm-up + {args.bench} timed rounds)\n")
+    report = bench(tests, args.base_url, args.bench, args.warmup)
+    regressions = bench_regressions(report, baseline, args.threshold) if baseline else {}
+    out = {
+        "base_url": args.base_url,
+        "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "iterations": args.bench,
+        "tests": report,
+        "regressions": regressions,
+    }
+    if args.bench_output:
+        with open(args.bench_output, "w", encoding="utf-8") as f:
+            json.dump(out, f, indent=2)
+            f.write("\n")
     if args.json:
-        results = [t.run(args.base_url) for t in tests]
-        out = {
-            "base_url": args.base_url,
-            "summary": dict(zip(("pass", "fail", "skip"), summarize(results))),
-            "results": [
-                {
-                    "name": r.name,
-                    "status": r.status,
-                    "detail": r.detail,
-                    "response": dataclasses.asdict(r.response) if r.response else None,
-                }
-                for r in results
-            ],
-        }
         json.dump(out, sys.stdout, indent=2)
         sys.stdout.write("\n")
     else:
-        print(f"Running {len(tests)} tests against {args.base_url}\n")
-        results = run(tests, args.base_url, args.verbose, use_color)
-        passed, failed, skipped = summarize(results)
-        print(f"\n{passed} passed, {failed} failed, {skipped} skipped")
-        if failed:
-            print("\nFailures:")
-            for r in results:
-                if r.status == "FAIL":
-                    print(f"  - {r.name}: {r.detail}")
-
-    _, failed, _ = summarize(results)
-    return 0 if failed == 0 else 1
+        print_bench(report, baseline, regressions)
+    errors = any(e["errors"] for e in report.values())
+    return 1 if regressions or errors else 0
 
 
 if __name__ == "__main__":
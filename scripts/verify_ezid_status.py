@@ -1,8 +1,15 @@
 import os
 
 import argparse
-import base64
+import io
+import json
 import re
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote, urlsplit
+import xml.etree.ElementTree as ET
 import requests
 from requests.auth import HTTPBasicAuth
 import shortuuid
@@ -10,11 +17,270 @@ import shortuuid
 from datetime import datetime, timedelta, timezone
 import time
 
+DEFAULT_JOBS = 8
+
+
+class Check:
+    """One check for run_checks: fn is called with the return values of the
+    checks named in `after`, once they and those named in `requires` have finished."""
+    def __init__(self, name, fn, after=(), requires=()):
+        self.name = name
+        self.fn = fn
+        self.after = list(after)
+        self.requires = list(requires)
+
+
+class _CheckOutput(io.TextIOBase):
+    """sys.stdout stand-in sending each thread's prints to the buffer of the check it runs."""
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def capture(self, buffer):
+        self._local.buffer = buffer
+
+    def write(self, s):
+        buffer = getattr(self._local, "buffer", None)
+        return (buffer if buffer is not None else self._stream).write(s)
+
+    def flush(self):
+        self._stream.flush()
+
+
+_current = threading.local()
+
+
+class CheckResult:
+    """Structured outcome of one check: status, wall-clock time, every HTTP request
+    it made (with status code and latency) and the identifiers it touched.
+
+    The status comes from the check's output lines: FAIL if any starts with
+    "Error"/"error" (or the check raised or was skipped), else PASS if any
+    starts with "ok", else INFO."""
+    def __init__(self, name):
+        self.name = name
+        self.status = "INFO"
+        self.completed = False
+        self.value = None
+        self.started_at = None
+        self.duration_ms = 0
+        self.requests = []
+        self.identifiers = []
+        self.messages = []
+        self.output = ""
+        self._lock = threading.Lock()
+
+    def add_request(self, response):
+        path = urlsplit(response.request.url).path
+        identifier = None
+        if path.startswith("/id/"):
+            identifier = unquote(path[len("/id/"):])
+        elif path.startswith("/shoulder/") and response.text.startswith("success:"):
+            identifier = response.text.split(":", 1)[1].split("|")[0].strip()
+        with self._lock:
+            self.requests.append({
+                "method": response.request.method,
+                "url": response.request.url,
+                "status_code": response.status_code,
+                "elapsed_ms": round(response.elapsed.total_seconds() * 1000),
+            })
+            if identifier and identifier not in self.identifiers:
+                self.identifiers.append(identifier)
+
+    def finish(self, output):
+        self.output = output
+        for line in output.splitlines():
+            text = line.strip()
+            level = text.split(" ", 1)[0].rstrip(":-").lower()
+            if level.startswith("error"):
+                self.messages.append({"level": "error", "text": text})
+            elif level in ("ok", "info"):
+                self.messages.append({"level": level, "text": text})
+        levels = {m["level"] for m in self.messages}
+        if not self.completed or "error" in levels:
+            self.status = "FAIL"
+        elif "ok" in levels:
+            self.status = "PASS"
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "requests": self.requests,
+            "identifiers": self.identifiers,
+            "messages": self.messages,
+        }
+
+
+def current_result():
+    return getattr(_current, "result", None)
+
+
+def use_result(result):
+    """Record the requests made on this thread in `result` (for threads a check starts)."""
+    _current.result = result
+
+
+def record_response(response, *args, **kwargs):
+    """requests response hook adding each response to the running check's CheckResult."""
+    result = current_result()
+    if result is not None:
+        result.add_request(response)
+
+
+def run_checks(checks, jobs=DEFAULT_JOBS):
+    """Run checks on up to `jobs` threads, each as soon as the checks it comes after
+    are done, and print their output in the order of `checks` as they finish.
+
+    Returns {check name: CheckResult}, with the check's return value in `value`.
+    A check that raised fails, and the checks after it are skipped."""
+    futures = {}
+    results = {}
+    output = _CheckOutput(sys.stdout)
+
+    def run(check):
+        result = CheckResult(check.name)
+        buffer = io.StringIO()
+        output.capture(buffer)
+        use_result(result)
+        started = time.monotonic()
+        try:
+            deps = [futures[name].result() for name in check.after]
+            required = [futures[name].result() for name in check.requires]
+            # time the check itself, not the wait for the checks it comes after
+            result.started_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+            started = time.monotonic()
+            failed = [dep.name for dep in deps + required if not dep.completed]
+            if failed:
+                print(f"## {check.name}\n  Error - skipped because {', '.join(failed)} failed")
+            else:
+                try:
+                    result.value = check.fn(*(dep.value for dep in deps))
+                    result.completed = True
+                except Exception:
+                    print(f"  Error - {check.name} raised:\n{traceback.format_exc()}")
+        finally:
+            output.capture(None)
+            use_result(None)
+            result.duration_ms = round((time.monotonic() - started) * 1000)
+            result.finish(buffer.getvalue())
+        return result
+
+    real_stdout, sys.stdout = sys.stdout, output
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            # checks are submitted in order, so a check's dependencies are always started before it
+            for check in checks:
+                futures[check.name] = pool.submit(run, check)
+            for check in checks:
+                result = futures[check.name].result()
+                real_stdout.write(result.output)
+                real_stdout.flush()
+                results[check.name] = result
+    finally:
+        sys.stdout = real_stdout
+    return results
+
+
+def _counts(results):
+    return {status: sum(r.status == status for r in results.values()) for status in ("PASS", "FAIL", "INFO")}
+
+
+def print_summary(results, duration_ms):
+    print("## Summary")
+    width = max(len(name) for name in results)
+    for result in results.values():
+        elapsed = [r["elapsed_ms"] for r in result.requests]
+        timing = f"{len(elapsed)} requests, slowest {max(elapsed)}ms" if elapsed else "no requests"
+        print(f"  {result.status:<4}  {result.name:<{width}}  {result.duration_ms / 1000:6.2f}s  {timing}")
+    counts = _counts(results)
+    print(f"  {len(results)} checks: {counts['PASS']} passed, {counts['FAIL']} failed, {counts['INFO']} info"
+          f" in {duration_ms / 1000:.2f}s")
+
+
+def write_json_report(path, results, env, base_url, started_at, duration_ms):
+    report = {
+        "env": env,
+        "base_url": base_url,
+        "started_at": started_at,
+        "duration_ms": duration_ms,
+        "summary": {status.lower(): count for status, count in _counts(results).items()},
+        "checks": [result.as_dict() for result in results.values()],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+
+def write_junit_report(path, results, env, started_at, duration_ms):
+    suites = ET.Element("testsuites")
+    suite = ET.SubElement(suites, "testsuite", name=f"ezid-{env}", tests=str(len(results)),
+                          failures=str(_counts(results)["FAIL"]), timestamp=started_at,
+                          time=f"{duration_ms / 1000:.3f}")
+    for result in results.values():
+        case = ET.SubElement(suite, "testcase", classname="verify_ezid_status", name=result.name,
+                             time=f"{result.duration_ms / 1000:.3f}")
+        if result.status == "FAIL":
+            errors = [m["text"] for m in result.messages if m["level"] == "error"]
+            failure = ET.SubElement(case, "failure", message=errors[0] if errors else "failed")
+            failure.text = "\n".join(errors)
+        timings = [f"{r['method']} {r['url']} -> {r['status_code']} ({r['elapsed_ms']}ms)" for r in result.requests]
+        ET.SubElement(case, "system-out").text = result.output + "\n".join(timings)
+    ET.ElementTree(suites).write(path, encoding="utf-8", xml_declaration=True)
+
+
 class VerifyEzidStatus:
-    def __init__(self, base_url, user, password):
+    def __init__(self, base_url, user, password, jobs=DEFAULT_JOBS, login=True):
         self.base_url = base_url
         self.user = user
         self.password = password
+        self.jobs = jobs
+        self.auth = HTTPBasicAuth(user, password)
+        self.login = login
+        self._logged_in = False
+        # one keep-alive connection pool shared by all checks, with a connection per concurrent job
+        self._adapter = requests.adapters.HTTPAdapter(pool_maxsize=jobs)
+        # public GETs (status, search, resolution, introspection) never carry the login cookie
+        self.session = self._new_session()
+        self.api_session = self._new_session()
+
+    def _new_session(self):
+        """A session on the shared connection pool that records its responses in the running check's result."""
+        session = requests.Session()
+        session.mount("http://", self._adapter)
+        session.mount("https://", self._adapter)
+        session.hooks["response"].append(record_response)
+        return session
+
+    def login_api_session(self):
+        """Log api_session in (GET /login), so EZID checks the deliberately slow password
+        hash once rather than on every API request; if that fails requests carry Basic auth.
+
+        Run as its own check before the ones using the API, so its cost is reported apart."""
+        print("## Log in for API requests")
+        status_code = -1
+        try:
+            r = self.api_session.get(f"{self.base_url}/login", auth=self.auth)
+            status_code = r.status_code
+            self._logged_in = r.status_code == 200 and "sessionid" in self.api_session.cookies
+        except requests.exceptions.RequestException as e:
+            status_code = "HTTPError: " + str(e)[:200]
+        if self._logged_in:
+            print("  ok - logged in, API requests use the session cookie")
+        else:
+            print(f"  Info - login failed - {status_code}, API requests use Basic auth")
+
+    def _api_request(self, method, url, **kwargs):
+        """Send an authenticated EZID API request on api_session."""
+        auth = None if self._logged_in else self.auth
+        r = self.api_session.request(method, url, auth=auth, **kwargs)
+        if r.status_code == 401 and auth is None:
+            # the login session expired or was dropped; use Basic auth from now on
+            self._logged_in = False
+            r = self.api_session.request(method, url, auth=self.auth, **kwargs)
+        return r
 
     def _get_status(self, url, allow_redirects=False):
         success = False
@@ -23,7 +289,7 @@ class VerifyEzidStatus:
         err_msg = ""
         location = ""
         try:
-            r = requests.get(url=url, allow_redirects=allow_redirects)
+            r = self.session.get(url=url, allow_redirects=allow_redirects)
             status_code = r.status_code
             r.raise_for_status()
             text = r.text
@@ -65,10 +331,9 @@ class VerifyEzidStatus:
 
         headers = {
             "Content-Type": content_type,
-            "Authorization": "Basic " + base64.b64encode(f"{self.user}:{self.password}".encode('utf-8')).decode('utf-8'),
         }
         try:
-            r = requests.post(url=url, headers=headers, data=data)
+            r = self._api_request("POST", url, headers=headers, data=data)
             status_code = r.status_code
             text = r.text
             success = True
@@ -102,32 +367,39 @@ class VerifyEzidStatus:
 
         return shoulder, id_created, text
 
-    def _create_identifiers(self):
-        shoulder_file_pairs = [
-            ("doi:10.15697/", "crossref_doi_10.15697_posted_content.txt"),
-            ("doi:10.15697/", "crossref_doi_10.15697_journal.txt"),
-            ("ark:/99999/fk4", "datacite_ark_99999_fk4.txt"),
-            ("doi:10.5072/FK2", "datacite_xml_doi_10.5072_FK2.txt"),
-            ("doi:10.5072/FK2", "datacite_doi_10.5072_FK2.txt"),
-            ("ark:/99999/fk4", "dc_ark_99999_fk4.txt"),
-            ("doi:10.5072/FK2", "dc_doi_10.5072_FK2.txt"),
-            ("ark:/99999/fk4", "erc_ark_99999_fk4.txt"),
-        ]
+    mint_records = [
+        ("doi:10.15697/", "crossref_doi_10.15697_posted_content.txt"),
+        ("doi:10.15697/", "crossref_doi_10.15697_journal.txt"),
+        ("ark:/99999/fk4", "datacite_ark_99999_fk4.txt"),
+        ("doi:10.5072/FK2", "datacite_xml_doi_10.5072_FK2.txt"),
+        ("doi:10.5072/FK2", "datacite_doi_10.5072_FK2.txt"),
+        ("ark:/99999/fk4", "dc_ark_99999_fk4.txt"),
+        ("doi:10.5072/FK2", "dc_doi_10.5072_FK2.txt"),
+        ("ark:/99999/fk4", "erc_ark_99999_fk4.txt"),
+    ]
+
+    def _mint(self, shoulder, filename):
+        file_path = os.path.join("./test_records/", filename)
+        record = self._get_record(file_path)
+        data = self._toAnvl(record).encode("UTF-8")
+        url = f"{self.base_url}/shoulder/{shoulder}"
 
-        status = []
-        for (shoulder, filename) in shoulder_file_pairs:
-            file_path = os.path.join("./test_records/", filename)
-            record = self._get_record(file_path)
-            data = self._toAnvl(record).encode("UTF-8")
-            url = f"{self.base_url}/shoulder/{shoulder}"
+        http_success, status_code, text, err_msg = self._post_data(url, data)
 
-            http_success, status_code, text, err_msg = self._post_data(url, data)
+        id_created = self._parse_id_created(text) if http_success else None
 
-            id_created = self._parse_id_created(text) if http_success else None
+        return shoulder, id_created, text
+
+    def _create_identifiers(self):
+        # the mint requests are independent, so send up to --jobs of them at once
+        result = current_result()
 
-            status.append((shoulder, id_created, text))
+        def mint(pair):
+            use_result(result)
+            return self._mint(*pair)
 
-        return status
+        with ThreadPoolExecutor(max_workers=min(self.jobs, len(self.mint_records))) as pool:
+            return list(pool.map(mint, self.mint_records))
 
     def _escape(self, s, colonToo=False):
         if colonToo:
@@ -186,10 +458,10 @@ class VerifyEzidStatus:
         unauthorized_url = f"{self.base_url}/shoulder/ark:/99166/p9"  # try minting unauthorized identifier, w/ POST
 
         # Start a session to persist cookies
-        session = requests.Session()
+        session = self._new_session()
 
         # Perform login using HTTP Basic Auth
-        response = session.get(login_url, auth=HTTPBasicAuth(self.user, self.password))
+        response = session.get(login_url, auth=self.auth)
 
         if response.status_code != 200:
             print(f"  Error: Login failed -- {response.status_code} - {response.text.strip()}")
@@ -238,10 +510,10 @@ class VerifyEzidStatus:
         logout_url = f"{self.base_url}/logout"
 
         # Start a session to persist cookies
-        session = requests.Session()
+        session = self._new_session()
 
         # Perform login using HTTP Basic Auth
-        response = session.get(login_url, auth=HTTPBasicAuth(self.user, self.password))
+        response = session.get(login_url, auth=self.auth)
 
         if response.status_code != 200:
             print(f"  Error: Login failed -- {response.status_code} - {response.text.strip()}")
@@ -309,7 +581,7 @@ class VerifyEzidStatus:
             print(f"  ok - {id_created} reserved")
             # delete the identifier
             url = f"{self.base_url}/id/{id_created}"
-            response = requests.delete(url, auth=(self.user, self.password))
+            response = self._api_request("DELETE", url)
             if response.status_code == 200:
                 print(f"  ok - {id_created} deleted")
             else:
@@ -382,7 +654,7 @@ class VerifyEzidStatus:
 
         url = f"{self.base_url}/id/{my_id}"
 
-        response = requests.put(url, params={'update_if_exists': 'yes'}, auth=(self.user, self.password))
+        response = self._api_request("PUT", url, params={'update_if_exists': 'yes'})
 
         if response.status_code in  (200,201):
             print(f"  ok - {my_id} created")
@@ -391,7 +663,7 @@ class VerifyEzidStatus:
             return
 
         # now update the same identifier with the same call again, and it should exist now
-        response = requests.put(url, params={'update_if_exists': 'yes'}, auth=(self.user, self.password))
+        response = self._api_request("PUT", url, params={'update_if_exists': 'yes'})
         if response.status_code in (200,201):
             print(f"  ok - {my_id} updated")
         else:
@@ -406,7 +678,7 @@ class VerifyEzidStatus:
             print(f"  Error - creating on {shoulder} failed - status_code: {status_code}: {text}: {err_msg}")
             return
 
-        response = requests.get(f'{self.base_url}/{id_created}/andmore?prefix_match=yes')
+        response = self.session.get(f'{self.base_url}/{id_created}/andmore?prefix_match=yes')
         if response.status_code == 200:
             print(f"  ok - {id_created} prefix match worked with extra string on end of ID being ignored")
         else:
@@ -420,14 +692,14 @@ class VerifyEzidStatus:
             print(f"  Error - creating on {shoulder} failed - status_code: {status_code}: {text}: {err_msg}")
             return
 
-        response = requests.get(f'{self.base_url}/{id_created}??')
+        response = self.session.get(f'{self.base_url}/{id_created}??')
         if response.status_code == 200 and 'what: test record under shoulder - ark:/99999/fk4' in response.text:
             print(f"  ok - ?? for instrospection: {id_created} returned introspection request")
         else:
             print(
                 f"  Error - ?? for instrospection - status_code: {response.status_code}: {response.text.strip()}")
 
-        response = requests.get(f'{self.base_url}/{id_created}?info')
+        response = self.session.get(f'{self.base_url}/{id_created}?info')
         if response.status_code == 200 and 'what: test record under shoulder - ark:/99999/fk4' in response.text:
             print(f"  ok - ?info for instrospection: {id_created} returned introspection request")
         else:
@@ -511,6 +783,12 @@ def main():
     parser.add_argument('-n', '--notify_email', type=str, required=False, help='Email address to receive download notification.')
     parser.add_argument('-s', '--skip-download', action='store_true', help='Skip batch download check')
     parser.add_argument('-d', '--days-before', type=int, default=3, help='Number of days before to check for batch downloads')
+    parser.add_argument('--json-report', type=str,
+                        help='Write each check\'s status, timing, requests and identifiers to this JSON file')
+    parser.add_argument('--junit-report', type=str, help='Write the check results to this JUnit XML file')
+    parser.add_argument('--basic-auth', action='store_true',
+                        help='Send Basic auth with every API request instead of logging in once and using the session cookie')
+    parser.add_argument('-j', '--jobs', type=int, default=DEFAULT_JOBS, help=f'Number of checks to run concurrently (default {DEFAULT_JOBS}); 1 runs them one by one')
 
     args = parser.parse_args()
 
@@ -534,37 +812,50 @@ def main():
 
     print(f"Starting EZID test suite on environment: {env} ({base_url})")
 
-    ves = VerifyEzidStatus(base_url, user, password)
-
-    ves.verify_ezid_status()
-
-    # Verify EZID version twice to ensure it is consistent among multiple instances
-    ves.verify_ezid_version(version, "1st run")
-    ves.verify_ezid_version(version, "2nd run")
-
-    ves.verify_search_function()
-
-    ves.verify_one_time_login()
-
-    ves.verify_one_time_login_logout()
-
-    created_ids = ves.verify_create_identifier_status()
-    ves.verify_update_identifier_status(created_ids)
-
-    ves.verify_reserve_and_delete_identifier()
-
-    ves.verify_status_transitions_for_identifier()
-
-    ves.verify_create_or_update_identifier()
-
-    ves.verify_prefix_matching()
-
-    ves.verify_introspection()
-
-    ves.check_resolver()
-
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    ves = VerifyEzidStatus(base_url, user, password, jobs=args.jobs, login=not args.basic_auth)
+
+    # Checks run concurrently, except that a check waits for those in its `after` and `requires`;
+    # output is printed in this order either way.
+    checks = [
+        Check("status", ves.verify_ezid_status),
+        # Verify EZID version twice to ensure it is consistent among multiple instances
+        Check("version 1st run", lambda: ves.verify_ezid_version(version, "1st run")),
+        Check("version 2nd run", lambda: ves.verify_ezid_version(version, "2nd run")),
+        Check("search", ves.verify_search_function),
+        Check("one time login", ves.verify_one_time_login),
+        Check("one time login and logout", ves.verify_one_time_login_logout),
+    ]
+    # the checks using the API wait for the shared login, which is timed as its own check
+    api = []
+    if ves.login:
+        checks.append(Check("login", ves.login_api_session))
+        api = ["login"]
+    checks += [
+        Check("mint", ves.verify_create_identifier_status, requires=api),
+        Check("update", ves.verify_update_identifier_status, after=["mint"]),
+        Check("reserve and delete", ves.verify_reserve_and_delete_identifier, requires=api),
+        Check("status transitions", ves.verify_status_transitions_for_identifier, requires=api),
+        Check("create or update", ves.verify_create_or_update_identifier, requires=api),
+        Check("prefix matching", ves.verify_prefix_matching, requires=api),
+        Check("introspection", ves.verify_introspection, requires=api),
+        Check("resolver", ves.check_resolver),
+    ]
     if not args.skip_download:
-        ves.check_batch_download(notify_email, days_before)
+        checks.append(Check("batch download", lambda: ves.check_batch_download(notify_email, days_before),
+                            requires=api))
+
+    started_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    started = time.monotonic()
+    results = run_checks(checks, args.jobs)
+    duration_ms = round((time.monotonic() - started) * 1000)
+    print_summary(results, duration_ms)
+    if args.json_report:
+        write_json_report(args.json_report, results, env, base_url, started_at, duration_ms)
+    if args.junit_report:
+        write_junit_report(args.junit_report, results, env, started_at, duration_ms)
 
 
 if __name__ == "__main__":